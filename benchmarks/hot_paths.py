@@ -0,0 +1,323 @@
+"""Offline benchmarks for the announcement and leaderboard hot paths.
+
+Runs without a Discord connection using fake ctx/guild/member objects and synthetic
+leaderboards. Results can be saved and compared between commits:
+
+    python benchmarks/hot_paths.py --sizes 100,10000 --save before.json
+    python benchmarks/hot_paths.py --sizes 100,10000 --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scnewsbot"
+    ),
+)
+
+from extensions import announcements, leaderboard  # noqa: E402
+
+DEFAULT_SIZES = "100,10000,100000"
+DEFAULT_POSTS_PER_USER = 20
+REGRESSION_THRESHOLD = 0.2
+SAMPLE_DESCRIPTION = "\n".join(
+    ["Patch 4.1 is live on the PTU."]
+    + [
+        f"- Fixed issue number {i} with a long enough description to matter"
+        for i in range(20)
+    ]
+    + [f"+ Sub point {i}" for i in range(20)]
+)
+
+
+# FAKES
+class FakeGuild:
+    def __init__(self, member_ids):
+        self.id = 1
+        self.members = {
+            member_id: SimpleNamespace(id=member_id, display_name=f"Member {member_id}")
+            for member_id in member_ids
+        }
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+def fake_ctx(guild, author_id):
+    return SimpleNamespace(guild=guild, author=SimpleNamespace(id=author_id))
+
+
+# DATA
+def synthetic_leaderboard(users, posts_per_user, seed=0):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    total_posts = users * posts_per_user
+    data = {}
+
+    # A handful of editors write most posts, like the real server.
+    weights = [1 / (rank + 1) for rank in range(users)]
+    counts = [0] * users
+    for index in rng.choices(range(users), weights=weights, k=total_posts):
+        counts[index] += 1
+
+    for index, count in enumerate(counts):
+        if not count:
+            continue
+
+        posts = sorted(
+            (now - timedelta(seconds=rng.randrange(3 * 365 * 86400))).isoformat()
+            for _ in range(count)
+        )
+        data[str(100000000000000000 + index)] = {
+            "count": count,
+            "last_post": posts[-1],
+            "posts": posts,
+        }
+
+    return data
+
+
+# TIMING
+def measure(fn, iterations, min_seconds=0.2):
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < iterations or time.perf_counter() - started < min_seconds:
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+        if len(samples) >= iterations * 100:
+            break
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return summarize(samples, peak)
+
+
+async def measure_async(fn, iterations, min_seconds=0.2):
+    # Same as measure() for coroutine functions, including any worker thread hops.
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < iterations or time.perf_counter() - started < min_seconds:
+        t = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t)
+        if len(samples) >= iterations * 100:
+            break
+
+    tracemalloc.start()
+    await fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return summarize(samples, peak)
+
+
+def summarize(samples, peak):
+    samples.sort()
+    return {
+        "ops_per_sec": len(samples) / sum(samples) if sum(samples) else float("inf"),
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[int(len(samples) * 0.95)] * 1000,
+        "p99_ms": samples[int(len(samples) * 0.99)] * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "peak_kib": peak / 1024,
+        "runs": len(samples),
+    }
+
+
+# SUITE
+async def run_size(users, posts_per_user, backend, workdir):
+    results = {}
+    path = os.path.join(workdir, f"leaderboard-{users}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(synthetic_leaderboard(users, posts_per_user), f)
+
+    def load():
+        if backend == "sqlite":
+            db = os.path.join(workdir, f"leaderboard-{users}.db")
+            if os.path.exists(db):
+                os.remove(db)
+            return leaderboard.SqliteLeaderboardData(db, import_from=path)
+
+        return leaderboard.LeaderboardData(path)
+
+    results["load"] = measure(load, iterations=1, min_seconds=0)
+    data = load()
+    leaderboard.leaderboard_data.instance = data
+
+    uids = [uid for uid, _ in data.get_sorted()]
+    top_uid = uids[0]
+    guild = FakeGuild(int(uid) for uid in uids[: leaderboard.USERS_PER_PAGE * 4])
+    ctx = fake_ctx(guild, int(top_uid))
+    start, end, _ = leaderboard.parse_period("--year")
+
+    results["record_post"] = measure(
+        lambda: data.record_post(random.choice(uids)), iterations=1000
+    )
+    results["get_sorted"] = measure(data.get_sorted, iterations=20)
+    results["rank_of"] = measure(
+        lambda: data.rank_of(random.choice(uids)), iterations=1000
+    )
+    results["user_30_days"] = measure(
+        lambda: data.user_30_days(top_uid), iterations=1000
+    )
+    results["user_year"] = measure(lambda: data.user_year(top_uid), iterations=1000)
+    results["global_stats"] = measure(data.global_stats, iterations=100)
+    results["ranked_between"] = await measure_async(
+        lambda: data.ranked_between(start, end), iterations=10
+    )
+
+    build_snapshot = lambda: leaderboard.LeaderboardSnapshot.build(
+        leaderboard.leaderboard_data, guild
+    )
+    results["snapshot"] = await measure_async(build_snapshot, iterations=10)
+    view = leaderboard.LeaderboardView(ctx, await build_snapshot())
+
+    def build_cold():
+        leaderboard.page_cache.pages.clear()
+        view.build_embed()
+
+    results["build_embed_cold"] = measure(build_cold, iterations=100)
+    results["build_embed_cached"] = measure(view.build_embed, iterations=1000)
+
+    await data.close()
+    return results
+
+
+def run_announcements():
+    ann = announcements.Announcement(
+        title="Patch 4.1", description=SAMPLE_DESCRIPTION, url="https://example.com"
+    )
+    return {
+        "process_special_chars": measure(
+            lambda: announcements.Announcement.process_special_chars(
+                SAMPLE_DESCRIPTION
+            ),
+            iterations=1000,
+        ),
+        "embed_cold": measure(
+            lambda: setattr(ann, "_embed", None) or ann.embed(), iterations=1000
+        ),
+        "embed_cached": measure(ann.embed, iterations=1000),
+    }
+
+
+# CHECKS
+async def check_sqlite_import(workdir):
+    # Switching LEADERBOARD_BACKEND must carry over posts that are still only in the
+    # JSON journal.
+    name = os.path.join(workdir, "switch")
+    json_data = leaderboard.create_leaderboard_data("json", name)
+    for uid in ("1", "2", "1", "3"):
+        json_data.record_post(uid)
+    await json_data.close()
+    expected = json_data.global_stats()[2]
+
+    sqlite_data = leaderboard.create_leaderboard_data("sqlite", name)
+    imported = sqlite_data.global_stats()[2]
+    await sqlite_data.close()
+
+    if imported != expected:
+        raise SystemExit(
+            f"SQLite import kept {imported} of {expected} posts from the JSON backend."
+        )
+
+
+async def run(args):
+    report = {"announcements": run_announcements()}
+    with tempfile.TemporaryDirectory() as workdir:
+        await check_sqlite_import(workdir)
+        for users in (int(size) for size in args.sizes.split(",")):
+            print(
+                f"Running leaderboard benchmarks for {users} users...", file=sys.stderr
+            )
+            report[f"leaderboard/{users}"] = await run_size(
+                users, args.posts_per_user, args.backend, workdir
+            )
+
+    return report
+
+
+# OUTPUT
+def print_report(report, baseline=None):
+    regressions = []
+    print(
+        f"{'benchmark':<44}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'peak KiB':>12}"
+    )
+    for group, benchmarks in report.items():
+        for name, result in benchmarks.items():
+            key = f"{group}/{name}"
+            line = (
+                f"{key:<44}{result['ops_per_sec']:>12.1f}{result['p50_ms']:>10.3f}"
+                f"{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+                f"{result['peak_kib']:>12.1f}"
+            )
+
+            before = (baseline or {}).get(group, {}).get(name)
+            if before:
+                change = (
+                    result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0
+                )
+                line += f"  {change:+.0%}"
+                if change > REGRESSION_THRESHOLD:
+                    regressions.append(key)
+
+            print(line)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes", default=DEFAULT_SIZES, help="comma separated user counts"
+    )
+    parser.add_argument("--posts-per-user", type=int, default=DEFAULT_POSTS_PER_USER)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument(
+        "--compare", help="compare p50 latencies against a saved JSON file"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    if regressions:
+        print(
+            f"Regressions over {REGRESSION_THRESHOLD:.0%}: {', '.join(regressions)}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
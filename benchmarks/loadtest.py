@@ -0,0 +1,593 @@
+"""End-to-end load test of the embed create -> Post flow against a Discord API stub.
+
+Runs the real Bot with the Announcements and Leaderboard extensions, but points its
+HTTP client at an aiohttp server on localhost that emulates the message, crosspost,
+interaction callback and follow-up endpoints, including per-route 429 responses.
+Gateway events (the command message and each component/modal interaction) are fed
+straight into the bot's connection state, so no Discord connection or token is needed.
+
+    python benchmarks/loadtest.py --editors 20 --rounds 3
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scnewsbot"
+    ),
+)
+
+import discord  # noqa: E402
+from bot import Bot  # noqa: E402
+from utils import Config  # noqa: E402
+from extensions import announcements  # noqa: E402
+
+GUILD_ID = 900000000000000000
+BOT_ID = 900000000000000001
+FIRST_EDITOR_ID = 910000000000000000
+FIRST_COMMAND_CHANNEL_ID = 920000000000000000
+PREFIX = "&"
+MESSAGE_LIMIT = (5, 5.0)
+CROSSPOST_LIMIT = (10, 3600.0)
+STEP_TIMEOUT = 120
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def user_payload(user_id, bot=False):
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def member_payload(user_id):
+    return {
+        "user": user_payload(user_id),
+        "roles": [],
+        "joined_at": now_iso(),
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+# STUB
+def json_response(data, status=200, headers=None):
+    # discord.py only parses bodies whose content type is exactly application/json.
+    return web.Response(
+        body=json.dumps(data).encode(),
+        status=status,
+        headers={**(headers or {}), "Content-Type": "application/json"},
+    )
+
+
+class RateLimiter:
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.windows = {}
+
+    def hit(self, key):
+        # Returns (allowed, remaining, reset_after) for a fixed window per key.
+        now = time.monotonic()
+        started, used = self.windows.get(key, (now, 0))
+        if now - started >= self.per:
+            started, used = now, 0
+
+        reset_after = self.per - (now - started)
+        if used >= self.limit:
+            return False, 0, reset_after
+
+        self.windows[key] = (started, used + 1)
+        return True, self.limit - used - 1, reset_after
+
+
+class DiscordStub:
+    def __init__(self):
+        self.ids = itertools.count(930000000000000000)
+        self.messages = {}
+        self.requests = Counter()
+        self.rate_limited = Counter()
+        self.stalled_seconds = 0.0
+        self.waiters = {}
+        self.events = defaultdict(list)
+        self.limits = {
+            "message": RateLimiter(*MESSAGE_LIMIT),
+            "crosspost": RateLimiter(*CROSSPOST_LIMIT),
+        }
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/api/v10/users/@me", self.get_me)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self.get_application)
+        app.router.add_post(
+            "/api/v10/channels/{channel_id}/messages", self.create_message
+        )
+        app.router.add_patch(
+            "/api/v10/channels/{channel_id}/messages/{message_id}", self.edit_message
+        )
+        app.router.add_delete(
+            "/api/v10/channels/{channel_id}/messages/{message_id}", self.delete_message
+        )
+        app.router.add_post(
+            "/api/v10/channels/{channel_id}/messages/{message_id}/crosspost",
+            self.crosspost,
+        )
+        app.router.add_post(
+            "/api/v10/interactions/{interaction_id}/{token}/callback", self.callback
+        )
+        app.router.add_post("/api/v10/webhooks/{application_id}/{token}", self.followup)
+        app.router.add_route("*", "/{tail:.*}", self.unknown)
+        return app
+
+    # Waiting on what the bot sends, so scripts can react to it.
+    def expect(self, key):
+        future = asyncio.get_running_loop().create_future()
+        for payload in self.events.pop(key, []):
+            if not future.done():
+                future.set_result(payload)
+                return future
+
+        self.waiters.setdefault(key, []).append(future)
+        return future
+
+    def emit(self, key, payload):
+        waiters = self.waiters.get(key)
+        if waiters:
+            waiters.pop(0).set_result(payload)
+        else:
+            self.events[key].append(payload)
+
+    def limited(self, kind, key):
+        allowed, remaining, reset_after = self.limits[kind].hit(key)
+        headers = {
+            "X-RateLimit-Limit": str(self.limits[kind].limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": f"{kind}-{key}",
+        }
+        if allowed:
+            return None, headers
+
+        self.rate_limited[kind] += 1
+        self.stalled_seconds += reset_after
+        body = {
+            "message": "You are being rate limited.",
+            "retry_after": reset_after,
+            "global": False,
+        }
+        return (
+            json_response(
+                body,
+                status=429,
+                headers={**headers, "Retry-After": f"{reset_after:.3f}"},
+            ),
+            headers,
+        )
+
+    def message_payload(self, channel_id, body, message_id=None):
+        return {
+            "id": str(message_id or next(self.ids)),
+            "channel_id": str(channel_id),
+            "guild_id": str(GUILD_ID),
+            "author": user_payload(BOT_ID, bot=True),
+            "content": body.get("content") or "",
+            "timestamp": now_iso(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": body.get("embeds") or [],
+            "components": body.get("components") or [],
+            "pinned": False,
+            "type": 0,
+            "flags": 0,
+        }
+
+    async def unknown(self, request):
+        self.requests[f"{request.method} (unhandled) {request.path}"] += 1
+        return json_response({"message": "Unknown route", "code": 0}, status=404)
+
+    async def get_me(self, request):
+        self.requests["GET /users/@me"] += 1
+        return json_response(user_payload(BOT_ID, bot=True))
+
+    async def get_application(self, request):
+        self.requests["GET /oauth2/applications/@me"] += 1
+        return json_response(
+            {
+                "id": str(BOT_ID),
+                "name": "SC News Bot",
+                "icon": None,
+                "description": "",
+                "rpc_origins": [],
+                "bot_public": False,
+                "bot_require_code_grant": False,
+                "owner": user_payload(FIRST_EDITOR_ID),
+                "summary": "",
+                "verify_key": "",
+                "flags": 0,
+            }
+        )
+
+    async def create_message(self, request):
+        self.requests["POST /channels/messages"] += 1
+        channel_id = int(request.match_info["channel_id"])
+        response, headers = self.limited("message", channel_id)
+        if response:
+            return response
+
+        payload = self.message_payload(channel_id, await request.json())
+        self.messages[int(payload["id"])] = payload
+        self.emit(("message", channel_id), payload)
+        return json_response(payload, headers=headers)
+
+    async def edit_message(self, request):
+        self.requests["PATCH /channels/messages"] += 1
+        channel_id = int(request.match_info["channel_id"])
+        message_id = int(request.match_info["message_id"])
+        response, headers = self.limited("message", channel_id)
+        if response:
+            return response
+
+        payload = self.message_payload(channel_id, await request.json(), message_id)
+        self.messages[message_id] = payload
+        return json_response(payload, headers=headers)
+
+    async def delete_message(self, request):
+        self.requests["DELETE /channels/messages"] += 1
+        return web.Response(status=204)
+
+    async def crosspost(self, request):
+        self.requests["POST /channels/messages/crosspost"] += 1
+        channel_id = int(request.match_info["channel_id"])
+        response, headers = self.limited("crosspost", channel_id)
+        if response:
+            return response
+
+        return json_response(
+            self.messages[int(request.match_info["message_id"])], headers=headers
+        )
+
+    async def callback(self, request):
+        self.requests["POST /interactions/callback"] += 1
+        body = await request.json()
+        self.emit(("callback", request.match_info["token"]), body)
+        interaction = {"id": request.match_info["interaction_id"], "type": body["type"]}
+        return json_response({"interaction": interaction})
+
+    async def followup(self, request):
+        self.requests["POST /webhooks (follow-up)"] += 1
+        body = await request.json()
+        payload = self.message_payload(0, body)
+        self.emit(("followup", request.match_info["token"]), body)
+        return json_response(payload)
+
+
+# EDITOR SCRIPT
+class Editor:
+    def __init__(self, harness, index):
+        self.harness = harness
+        self.user_id = FIRST_EDITOR_ID + index
+        self.command_channel_id = FIRST_COMMAND_CHANNEL_ID + index
+        self.target_channel_id = announcements.CHANNEL_OPTIONS[
+            index % len(announcements.CHANNEL_OPTIONS)
+        ][1]
+
+    def interaction(self, type, data, message=None):
+        interaction_id = next(self.harness.stub.ids)
+        token = f"token-{interaction_id}"
+        payload = {
+            "id": str(interaction_id),
+            "application_id": str(BOT_ID),
+            "type": type,
+            "data": data,
+            "guild_id": str(GUILD_ID),
+            "channel_id": str(self.command_channel_id),
+            "channel": {
+                "id": str(self.command_channel_id),
+                "type": 0,
+                "guild_id": str(GUILD_ID),
+            },
+            "member": {**member_payload(self.user_id), "permissions": "8"},
+            "token": token,
+            "version": 1,
+            "app_permissions": "8",
+            "locale": "en-US",
+            "guild_locale": "en-US",
+            "entitlements": [],
+            "authorizing_integration_owners": {},
+            "attachment_size_limit": 26214400,
+        }
+        if message:
+            payload["message"] = message
+
+        self.harness.bot._connection.parse_interaction_create(payload)
+        return token
+
+    async def wait(self, key):
+        return await asyncio.wait_for(self.harness.stub.expect(key), STEP_TIMEOUT)
+
+    @staticmethod
+    def component(message, label=None, type=None):
+        for row in message["components"]:
+            for component in row["components"]:
+                if component.get("label") == label or (
+                    type and component["type"] == type
+                ):
+                    return component
+
+        raise LookupError(f"No component {label or type} on the builder message.")
+
+    async def run(self, title):
+        stub = self.harness.stub
+        started = time.perf_counter()
+
+        builder = stub.expect(("message", self.command_channel_id))
+        self.harness.bot._connection.parse_message_create(
+            {
+                **stub.message_payload(
+                    self.command_channel_id, {"content": f"{PREFIX}embed create"}
+                ),
+                "author": user_payload(self.user_id),
+                "member": member_payload(self.user_id),
+            }
+        )
+        message = await asyncio.wait_for(builder, STEP_TIMEOUT)
+
+        # The stub sees the message before the bot has its response and the view.
+        views = self.harness.bot._connection._view_store._views
+        while int(message["id"]) not in views:
+            await asyncio.sleep(0.001)
+
+        # Title button -> modal -> modal submit.
+        button = self.component(message, label="Title")
+        token = self.interaction(
+            3, {"custom_id": button["custom_id"], "component_type": 2}, message
+        )
+        modal = (await self.wait(("callback", token)))["data"]
+        text_input = modal["components"][0]["components"][0]
+        while (
+            modal["custom_id"] not in self.harness.bot._connection._view_store._modals
+        ):
+            await asyncio.sleep(0.001)
+        token = self.interaction(
+            5,
+            {
+                "custom_id": modal["custom_id"],
+                "components": [
+                    {
+                        "type": 1,
+                        "components": [
+                            {
+                                "type": 4,
+                                "custom_id": text_input["custom_id"],
+                                "value": title,
+                            }
+                        ],
+                    }
+                ],
+            },
+            message,
+        )
+        await self.wait(("callback", token))
+
+        # Channel select.
+        select = self.component(message, type=3)
+        token = self.interaction(
+            3,
+            {
+                "custom_id": select["custom_id"],
+                "component_type": 3,
+                "values": [str(self.target_channel_id)],
+            },
+            message,
+        )
+        await self.wait(("callback", token))
+
+        if self.harness.publish:
+            button = self.component(message, label="Published: ❌")
+            token = self.interaction(
+                3, {"custom_id": button["custom_id"], "component_type": 2}, message
+            )
+            await self.wait(("callback", token))
+
+        # Post.
+        button = self.component(message, label="Post")
+        token = self.interaction(
+            3, {"custom_id": button["custom_id"], "component_type": 2}, message
+        )
+        await self.wait(("callback", token))
+        while True:
+            followup = await self.wait(("followup", token))
+            if not followup.get("flags"):
+                break
+
+        return time.perf_counter() - started
+
+
+# HARNESS
+class Harness:
+    def __init__(self, publish):
+        self.stub = DiscordStub()
+        self.publish = publish
+        self.bot = None
+
+    async def start(self):
+        runner = web.AppRunner(self.stub.app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        discord.http.Route.BASE = f"http://127.0.0.1:{port}/api/v10"
+        self.runner = runner
+
+        config = Config(
+            {
+                "bot": {
+                    "prefix": PREFIX,
+                    "extensions": [
+                        "extensions.leaderboard",
+                        "extensions.announcements",
+                    ],
+                },
+                "permissions": {},
+            }
+        )
+        self.bot = Bot(config)
+        await self.bot.login("stub-token")
+        self.bot._connection.application_id = BOT_ID
+        self.add_guild()
+
+    def add_guild(self, editors=0):
+        channels = [
+            {
+                "id": str(channel_id),
+                "type": 5,
+                "name": name.lower().replace(" ", "-"),
+                "position": i,
+            }
+            for i, (name, channel_id) in enumerate(announcements.CHANNEL_OPTIONS)
+        ]
+        channels += [
+            {"id": str(channel_id), "type": 0, "name": f"log-{i}", "position": 100 + i}
+            for i, channel_id in enumerate(announcements.LOGGING_CHANNEL_IDS)
+        ]
+        channels += [
+            {
+                "id": str(FIRST_COMMAND_CHANNEL_ID + i),
+                "type": 0,
+                "name": f"editor-{i}",
+                "position": 200 + i,
+            }
+            for i in range(editors)
+        ]
+        roles = [
+            {
+                "id": str(GUILD_ID),
+                "name": "@everyone",
+                "permissions": "0",
+                "position": 0,
+            }
+        ]
+        roles += [
+            {"id": str(role_id), "name": name, "permissions": "0", "position": 1 + i}
+            for i, (name, role_id) in enumerate(announcements.PING_ROLE_OPTIONS)
+        ]
+        guild = discord.Guild(
+            data={
+                "id": str(GUILD_ID),
+                "name": "Load Test",
+                "channels": channels,
+                "roles": roles,
+                "members": [],
+                "member_count": 1,
+                "features": [],
+            },
+            state=self.bot._connection,
+        )
+        self.bot._connection._add_guild(guild)
+
+    async def close(self):
+        await self.bot.close()
+        await self.runner.cleanup()
+
+
+async def run(args):
+    harness = Harness(publish=args.publish)
+    await harness.start()
+    harness.add_guild(args.editors)
+    baseline_requests = sum(harness.stub.requests.values())
+
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+    for round_index in range(args.rounds):
+        editors = [Editor(harness, i) for i in range(args.editors)]
+        results = await asyncio.gather(
+            *(
+                editor.run(f"Load test {round_index}-{i}")
+                for i, editor in enumerate(editors)
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                failures += 1
+                print(f"Editor failed: {result!r}", file=sys.stderr)
+            else:
+                latencies.append(result)
+
+    wall = time.perf_counter() - started
+    stub = harness.stub
+    await harness.close()
+
+    announcements_posted = len(latencies)
+    total_requests = sum(stub.requests.values()) - baseline_requests
+    print(f"Announcements posted:        {announcements_posted} ({failures} failed)")
+    print(f"Wall time:                   {wall:.2f} s")
+    if announcements_posted:
+        latencies.sort()
+        print(
+            f"Requests per announcement:   {total_requests / announcements_posted:.1f}"
+        )
+        print(
+            "End-to-end latency:          "
+            f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms, "
+            f"max {latencies[-1] * 1000:.0f} ms, "
+            f"mean {statistics.fmean(latencies) * 1000:.0f} ms"
+        )
+    print(f"429 responses:               {dict(stub.rate_limited) or 0}")
+    print(f"Rate-limit stall time:       {stub.stalled_seconds:.2f} s")
+    print(f"Dispatcher:                  {harness.bot.dispatcher.metrics()}")
+    print("Requests by route:")
+    for route, count in stub.requests.most_common():
+        print(f"  {route:<40}{count:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--editors", type=int, default=20, help="editors posting at the same time"
+    )
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument(
+        "--publish", action="store_true", help="toggle Published before posting"
+    )
+    args = parser.parse_args()
+    discord.utils.setup_logging(level=logging.WARNING)
+
+    # The leaderboard extension writes into the working directory.
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
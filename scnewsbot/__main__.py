@@ -1,5 +1,5 @@
-import tomllib
 import os
+import time
 from dotenv import load_dotenv
 from bot import Bot
 from utils import Config
@@ -14,10 +14,14 @@ def main() -> None:
     if not DISCORD_TOKEN:
         raise InvalidTokenException("A Discord token was not set.")
 
-    with open("config.toml", "rb") as config_file:
-        config = Config(tomllib.load(config_file))
+    started = time.perf_counter()
+    config = Config.from_file("config.toml")
+    config_seconds = time.perf_counter() - started
 
     bot = Bot(config)
+    bot.started_at = started
+    bot.startup_timings["config"] = config_seconds
+    bot.startup_timings["bot"] = time.perf_counter() - started - config_seconds
     bot.run(DISCORD_TOKEN)
 
 
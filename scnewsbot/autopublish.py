@@ -0,0 +1,151 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter, deque
+from typing import TYPE_CHECKING
+import discord
+from dispatch import PRIORITY_ANNOUNCEMENT
+
+if TYPE_CHECKING:
+    from bot import Bot
+
+# Discord allows 10 crossposts per news channel per hour.
+CROSSPOST_LIMIT = 10
+CROSSPOST_WINDOW = 3600.0
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 5.0
+
+
+class CrosspostQuota:
+    def __init__(
+        self, limit: int = CROSSPOST_LIMIT, window: float = CROSSPOST_WINDOW
+    ) -> None:
+        self.limit = limit
+        self.window = window
+        self.history: dict[int, deque[float]] = {}
+
+    def _expire(self, channel_id: int, now: float) -> deque[float]:
+        history = self.history.setdefault(channel_id, deque())
+        while history and history[0] <= now - self.window:
+            history.popleft()
+
+        return history
+
+    def available_at(self, channel_id: int) -> float:
+        # When the channel can next publish; 0 means right away.
+        history = self._expire(channel_id, time.monotonic())
+        if len(history) < self.limit:
+            return 0.0
+
+        return history[0] + self.window
+
+    def record(self, channel_id: int) -> None:
+        now = time.monotonic()
+        self._expire(channel_id, now).append(now)
+
+
+# Publishes messages in the configured news channels from a single scheduled queue,
+# deferring them past the crosspost quota instead of blocking the listener.
+class AutoPublisher:
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        self.quota = CrosspostQuota()
+        self.queue: list[tuple] = []
+        self.order = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.inflight: set[asyncio.Task] = set()
+        self.stats = Counter()
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        tasks = [task for task in (self.task, *self.inflight) if task]
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+
+    def handle(self, message: discord.Message) -> None:
+        if (
+            message.channel.id not in self.bot.config.publish_channels
+            or message.channel.type is not discord.ChannelType.news
+        ):
+            return
+
+        self._schedule(time.monotonic(), message.channel.id, message.id, 1)
+
+    def _schedule(
+        self, due: float, channel_id: int, message_id: int, attempt: int
+    ) -> None:
+        heapq.heappush(
+            self.queue, (due, next(self.order), channel_id, message_id, attempt)
+        )
+        self.wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            if not self.queue:
+                await self.wakeup.wait()
+            else:
+                delay = self.queue[0][0] - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+
+            self.wakeup.clear()
+
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now:
+                _, _, channel_id, message_id, attempt = heapq.heappop(self.queue)
+
+                available_at = self.quota.available_at(channel_id)
+                if available_at > now:
+                    self.stats["deferred"] += 1
+                    self._schedule(available_at, channel_id, message_id, attempt)
+                    continue
+
+                self.quota.record(channel_id)
+                task = asyncio.create_task(
+                    self._publish(channel_id, message_id, attempt)
+                )
+                self.inflight.add(task)
+                task.add_done_callback(self.inflight.discard)
+
+    async def _publish(self, channel_id: int, message_id: int, attempt: int) -> None:
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            self.stats["failed"] += 1
+            return
+
+        message = channel.get_partial_message(message_id)
+        try:
+            await self.bot.dispatcher.submit(
+                ("crosspost", channel_id),
+                message.publish,
+                priority=PRIORITY_ANNOUNCEMENT,
+            )
+        except (discord.Forbidden, discord.NotFound):
+            self.stats["failed"] += 1
+        except discord.HTTPException:
+            if attempt >= MAX_ATTEMPTS:
+                self.stats["failed"] += 1
+                return
+
+            self.stats["retried"] += 1
+            delay = RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            self._schedule(
+                time.monotonic() + delay, channel_id, message_id, attempt + 1
+            )
+        else:
+            self.stats["published"] += 1
+
+    def metrics(self) -> dict:
+        return {"queued": len(self.queue), **self.stats}
@@ -1,62 +1,246 @@
-import subprocess
+import asyncio
+import os
+import time
+from contextlib import contextmanager
 from discord.ext import commands
 from discord.ui import Button
 import discord
 import datetime
 from utils import Config
+from dispatch import RATELIMIT_TIMEOUT, Dispatcher
+from autopublish import AutoPublisher
+from metrics import metrics
 
 VERSION = "3.0.2"
 INTENTS = discord.Intents.default()
 INTENTS.message_content = True
 INTENTS.members = True
+CONFIG_WATCH_INTERVAL = 5
+GIT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".git"
+)
 
 
-class Bot(commands.Bot):
+def resolve_commit() -> str | None:
+    # Builds can pin the commit with SCNEWSBOT_COMMIT; otherwise read it straight from
+    # .git.
+    commit = os.getenv("SCNEWSBOT_COMMIT")
+    if commit:
+        return commit[:7]
+
+    try:
+        with open(os.path.join(GIT_DIR, "HEAD"), encoding="ascii") as f:
+            head = f.read().strip()
+
+        if not head.startswith("ref: "):
+            return head[:7]
+
+        ref = head[5:]
+        ref_path = os.path.join(GIT_DIR, ref)
+        if os.path.exists(ref_path):
+            with open(ref_path, encoding="ascii") as f:
+                return f.read().strip()[:7]
+
+        with open(os.path.join(GIT_DIR, "packed-refs"), encoding="ascii") as f:
+            for line in f:
+                if line.rstrip().endswith(" " + ref):
+                    return line[:7]
+    except OSError:
+        pass
+
+    return None
+
+
+def get_prefix(bot: "Bot", message: discord.Message) -> list[str]:
+    # Read on every message so a reloaded prefix applies straight away.
+    return commands.when_mentioned_or(bot.config.prefix)(bot, message)
+
+
+class Bot(commands.AutoShardedBot):
     def __init__(self, config: Config, /) -> None:
         super().__init__(
             intents=INTENTS,
-            command_prefix=commands.when_mentioned_or(config.prefix),
+            command_prefix=get_prefix,
             allowed_mentions=discord.AllowedMentions(everyone=False),
             case_insensitive=True,
+            shard_count=config.shard_count,
+            max_ratelimit_timeout=RATELIMIT_TIMEOUT,
             activity=discord.Activity(
                 type=discord.ActivityType.watching, name="Writing some news!"
             ),
         )
         self.config = config
         self.version = VERSION
+        self.commit = resolve_commit()
+        self.started_at = time.perf_counter()
+        self.startup_timings: dict[str, float] = {}
+        self.dispatcher = Dispatcher()
+        self.autopublisher = AutoPublisher(self)
+        self.config_watcher: asyncio.Task | None = None
+        self.lag_watcher: asyncio.Task | None = None
+        self.metrics_server = None
 
     async def setup_hook(self) -> None:
-        for extension in self.config.extensions:
+        self.dispatcher.start()
+        self.autopublisher.start()
+
+        if self.config.watch and self.config.path:
+            self.config_watcher = asyncio.create_task(self._watch_config())
+
+        metrics.sources["dispatcher"] = self.dispatcher.metrics
+        metrics.sources["autopublish"] = self.autopublisher.metrics
+        metrics.sources["gateway"] = lambda: {"latency_seconds": self.latency}
+        self.lag_watcher = asyncio.create_task(metrics.watch_loop_lag())
+        if self.config.metrics_port:
+            self.metrics_server = await metrics.serve(
+                self.config.metrics_host, self.config.metrics_port
+            )
+
+        with self.timed("extensions"):
+            if self.config.fast_startup:
+                await asyncio.gather(
+                    *(
+                        self._load_extension_timed(extension)
+                        for extension in self.config.extensions
+                    )
+                )
+            else:
+                for extension in self.config.extensions:
+                    await self._load_extension_timed(extension)
+
+        with self.timed("core cog"):
+            await self.add_cog(CoreCog(self))
+
+    @contextmanager
+    def timed(self, phase: str, /):
+        # Reserve the slot first so phases are reported in the order they started.
+        self.startup_timings[phase] = 0.0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - started
+
+    async def _load_extension_timed(self, extension: str, /) -> None:
+        with self.timed(f"  {extension}"):
             await self.load_extension(extension)
 
-        await self.add_cog(CoreCog(self))
+    def startup_report(self) -> str:
+        lines = [
+            f"{phase:<40}{seconds * 1000:>9.1f} ms"
+            for phase, seconds in self.startup_timings.items()
+        ]
+        total = time.perf_counter() - self.started_at
+        lines.append(f"{'total until ready':<40}{total * 1000:>9.1f} ms")
+        return "\n".join(lines)
+
+    async def reload_config(self) -> Config:
+        # Parsing happens before the swap, so a broken file leaves the old config in
+        # place.
+        self.config = await asyncio.to_thread(Config.from_file, self.config.path)
+        return self.config
+
+    async def _watch_config(self) -> None:
+        seen = self.config.mtime
+        while True:
+            await asyncio.sleep(CONFIG_WATCH_INTERVAL)
+            try:
+                mtime = os.stat(self.config.path).st_mtime
+                if mtime != seen:
+                    seen = mtime
+                    await self.reload_config()
+                    print("The config was changed on disk and has been reloaded.")
+            except Exception as e:
+                print(f"Could not reload the config: {e}")
+
+    async def invoke(self, ctx: commands.Context, /) -> None:
+        started = time.perf_counter()
+        await super().invoke(ctx)
+        if ctx.command:
+            metrics.observe(
+                f"command {ctx.command.qualified_name}",
+                time.perf_counter() - started,
+                failed=ctx.command_failed,
+            )
+
+    async def close(self) -> None:
+        for task in (self.config_watcher, self.lag_watcher):
+            if task:
+                task.cancel()
+
+        if self.metrics_server:
+            await self.metrics_server.cleanup()
+
+        await super().close()
+        await self.autopublisher.close()
+        await self.dispatcher.close()
 
 
 class CoreCog(commands.Cog, name="Core"):
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
 
-    def _get_version(self) -> str:
-        return (
-            subprocess.check_output(["git", "rev-parse", "--short", "HEAD"])
-            .decode("ascii")
-            .strip()
-        )
-
     @commands.Cog.listener()
     async def on_ready(self) -> None:
         print("The News Bot is now ready.")
+        if not self.bot.startup_timings.get("ready"):
+            self.bot.startup_timings["ready"] = (
+                time.perf_counter() - self.bot.started_at
+            )
+            print("Startup timings:\n" + self.bot.startup_report())
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
-        if (
-            message.channel.id in self.bot.config.publish_channels
-            and message.channel.type is discord.ChannelType.news
-        ):
-            try:
-                await message.publish()
-            except discord.Forbidden:
-                pass
+        with metrics.timer("listener auto-publish"):
+            self.bot.autopublisher.handle(message)
+
+    @commands.group(invoke_without_command=True)
+    @commands.is_owner()
+    async def config(self, ctx: commands.Context) -> None:
+        await ctx.send_help(ctx.command)
+
+    @config.command(
+        name="reload", description="Reloads the config file without a restart."
+    )
+    @commands.is_owner()
+    async def config_reload(self, ctx: commands.Context) -> None:
+        try:
+            await self.bot.reload_config()
+        except Exception as e:
+            await ctx.reply(
+                f"The config could not be reloaded: {e}", mention_author=False
+            )
+            return
+
+        await ctx.reply(
+            "The config has been reloaded. "
+            "Changes to extensions apply after a restart.",
+            mention_author=False,
+        )
+
+    @commands.hybrid_command(description="Shows latency and error stats for the bot.")
+    async def stats(self, ctx: commands.Context) -> None:
+        lines = [f"{'name':<34}{'count':>7}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}"]
+        for name, histogram in sorted(metrics.latency.items()):
+            lines.append(
+                f"{name[:34]:<34}{histogram.count:>7}{metrics.errors[name]:>7}"
+                f"{histogram.percentile(0.5) * 1000:>9.1f}"
+                f"{histogram.percentile(0.95) * 1000:>9.1f}"
+            )
+
+        embed = discord.Embed(color=self.bot.config.embed_color, title="Stats")
+        embed.description = "```\n" + "\n".join(lines)[:4000] + "\n```"
+        embed.add_field(name="Gateway", value=f"{self.bot.latency * 1000:.0f} ms")
+        embed.add_field(
+            name="Event loop lag (p95)",
+            value=f"{metrics.loop_lag.percentile(0.95) * 1000:.1f} ms",
+        )
+        dispatcher = self.bot.dispatcher.metrics()
+        embed.add_field(
+            name="Dispatch queue",
+            value=f"{dispatcher['depth']} queued, {dispatcher['parked']} waiting",
+        )
+        await ctx.reply(embed=embed, mention_author=False)
 
     @commands.hybrid_command(description="Shows you some info about the bot.")
     async def info(self, ctx: commands.Context) -> None:
@@ -66,7 +250,9 @@ class CoreCog(commands.Cog, name="Core"):
             description="The SC News Bot is a bot created for the r/starcitizen Discord server to help with writing news posts.",
         )
         embed.add_field(
-            name="Version", value=f"v{self.bot.version}"
+            name="Version",
+            value=f"v{self.bot.version}"
+            + (f" ({self.bot.commit})" if self.bot.commit else ""),
         )
         embed.add_field(
             name="Library", value=f"discord.py v{discord.__version__}", inline=False
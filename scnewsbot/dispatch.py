@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+import discord
+
+# Lower numbers are sent first.
+PRIORITY_ANNOUNCEMENT = 0
+PRIORITY_PING = 1
+PRIORITY_LOG = 2
+
+MAX_QUEUE_SIZE = 500
+WORKERS = 4
+
+# (requests, per seconds) for each kind of route.
+# Routes are keyed by (kind, channel id).
+ROUTE_LIMITS = {
+    "message": (5, 5.0),
+    "crosspost": (10, 3600.0),
+}
+DEFAULT_LIMIT = (5, 5.0)
+
+# Passed to the client as max_ratelimit_timeout, so longer 429 waits raise
+# discord.RateLimited into the workers' backoff instead of sleeping inside the library.
+# discord.py does not accept anything lower than 30 seconds.
+RATELIMIT_TIMEOUT = 30.0
+
+
+class TokenBucket:
+    def __init__(self, rate: int, per: float) -> None:
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.fill_rate
+        )
+        self.updated = now
+
+    def acquire(self) -> float:
+        # Takes a token and returns 0, or returns how long to wait for one.
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.fill_rate
+
+    def penalize(self, retry_after: float) -> None:
+        # Sets the bucket so the next acquire() on the route waits exactly retry_after;
+        # Discord's wait replaces the bucket's own, rather than adding to it.
+        self._refill()
+        self.tokens = 1 - retry_after * self.fill_rate
+
+
+# Sends Discord API calls through per-route token buckets, in priority order.
+class Dispatcher:
+    def __init__(
+        self, max_queue_size: int = MAX_QUEUE_SIZE, workers: int = WORKERS
+    ) -> None:
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue(max_queue_size)
+        self.workers = workers
+        self.buckets: dict[tuple, TokenBucket] = {}
+        self.tasks: list[asyncio.Task] = []
+        self.parked_tasks: set[asyncio.Task] = set()
+        self.order = itertools.count()
+        self.stats = Counter()
+        self.max_depth = 0
+        self.parked = 0
+        self.blocked_seconds = 0.0
+        self.queued_seconds = 0.0
+
+    def start(self) -> None:
+        if not self.tasks:
+            self.tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def close(self) -> None:
+        tasks = [*self.tasks, *self.parked_tasks]
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = []
+
+    def bucket(self, route: tuple) -> TokenBucket:
+        if route not in self.buckets:
+            self.buckets[route] = TokenBucket(
+                *ROUTE_LIMITS.get(route[0], DEFAULT_LIMIT)
+            )
+
+        return self.buckets[route]
+
+    async def submit(
+        self, route: tuple, call, /, priority: int = PRIORITY_ANNOUNCEMENT
+    ):
+        # Queues call(), a coroutine function, and waits for its result. When the queue
+        # is full this waits for room, which is where backpressure shows up.
+        future = asyncio.get_running_loop().create_future()
+        item = (priority, next(self.order), route, call, future, time.monotonic())
+
+        if self.queue.full():
+            self.stats["blocked"] += 1
+            started = time.monotonic()
+            await self.queue.put(item)
+            self.blocked_seconds += time.monotonic() - started
+        else:
+            self.queue.put_nowait(item)
+
+        self.stats["submitted"] += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+        return await future
+
+    def _park(self, item: tuple, delay: float) -> None:
+        # Throttled calls wait in their own task rather than in a worker, so other
+        # routes keep moving.
+        task = asyncio.create_task(self._requeue_later(item, delay))
+        self.parked_tasks.add(task)
+        task.add_done_callback(self.parked_tasks.discard)
+
+    async def _requeue_later(self, item: tuple, delay: float) -> None:
+        self.parked += 1
+        try:
+            await asyncio.sleep(delay)
+            await self.queue.put(item)
+        finally:
+            self.parked -= 1
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self.queue.get()
+            priority, _, route, call, future, queued_at = item
+
+            try:
+                if future.cancelled():
+                    continue
+
+                delay = self.bucket(route).acquire()
+                if delay:
+                    self.stats["throttled"] += 1
+                    self._park(item, delay)
+                    continue
+
+                self.queued_seconds += time.monotonic() - queued_at
+
+                try:
+                    result = await call()
+                except discord.RateLimited as e:
+                    self.stats["rate_limited"] += 1
+                    # The drained bucket makes the retry wait out retry_after.
+                    self.bucket(route).penalize(e.retry_after)
+                    self._park(item, 0)
+                    continue
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+
+                self.stats["sent"] += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.queue.task_done()
+
+    def metrics(self) -> dict:
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "parked": self.parked,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "queued_seconds": round(self.queued_seconds, 3),
+            **self.stats,
+        }
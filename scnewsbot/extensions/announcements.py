@@ -1,8 +1,20 @@
 from __future__ import annotations
+import asyncio
+import json
+import os
+import secrets
+import time
+import heapq
+from collections import OrderedDict
 import discord
 from discord.ext import commands
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from extensions import leaderboard
+from dispatch import PRIORITY_ANNOUNCEMENT, PRIORITY_PING, PRIORITY_LOG
+from metrics import metrics
+from utils import GuildOptions
+from search import AnnouncementIndex, IndexedAnnouncement
+from writebehind import WriteBehind
 
 # CONFIG
 DEFAULT_IMAGE_URL = "https://cdn.discordapp.com/attachments/611922107345141760/1348673800874754088/Polaris_over_Yela_bright.png"
@@ -36,11 +48,67 @@ LEADERBOARD_CHANNEL_IDS = {
     585952222853201941,
 }
 
+# Used by guilds that have no [guilds.<id>] table in the config.
+DEFAULT_GUILD_OPTIONS = GuildOptions(
+    {
+        "channels": CHANNEL_OPTIONS,
+        "ping_roles": PING_ROLE_OPTIONS,
+        "leaderboard_channels": LEADERBOARD_CHANNEL_IDS,
+        "logging_channels": LOGGING_CHANNEL_IDS,
+        "leaderboard": leaderboard.LEADERBOARD_NAME,
+    }
+)
+
 EMBED_COLOR = discord.Color.blurple()
-TIMEOUT = 900
+DRAFTS_FILE = "drafts.json"
+# Set POSTED_CACHE_FILE to an empty value to keep the posted announcement cache in
+# memory only.
+POSTED_CACHE_FILE = os.getenv("POSTED_CACHE_FILE", "posted.json")
+POSTED_CACHE_SIZE = 500
+POSTED_CACHE_TTL = 30 * 86400
+SCHEDULE_FILE = "scheduled.json"
+DRAFT_TTL = 86400
+MAX_DRAFTS = 100
 
 # DATA MODEL
 class Announcement:
+    __slots__ = (
+        "title",
+        "description",
+        "url",
+        "image_url",
+        "video_url",
+        "channel",
+        "ping",
+        "ping_preview",
+        "publish",
+        "changed",
+        "_embed",
+    )
+    RECORD_FIELDS = (
+        "title",
+        "description",
+        "url",
+        "image_url",
+        "video_url",
+        "ping_preview",
+        "publish",
+    )
+    TRACKED_FIELDS = frozenset(
+        {
+            "title",
+            "description",
+            "url",
+            "image_url",
+            "video_url",
+            "channel",
+            "ping",
+            "ping_preview",
+            "publish",
+        }
+    )
+    EMBED_FIELDS = frozenset({"title", "description", "url", "image_url"})
+
     def __init__(
         self,
         title: str = "",
@@ -53,6 +121,8 @@ class Announcement:
         ping_preview: str | None = None,
         publish: bool = False,
     ):
+        self.changed = set()
+        self._embed = None
         self.title = title
         self.description = self.process_special_chars(description)
         self.url = url
@@ -62,6 +132,19 @@ class Announcement:
         self.ping = ping
         self.ping_preview = ping_preview
         self.publish = publish
+        self.changed.clear()
+
+    def __setattr__(self, name, value):
+        # Remember which fields really changed so the Builder only re-renders those.
+        if name in self.TRACKED_FIELDS and getattr(self, name, None) != value:
+            self.changed.add(name)
+            if name in self.EMBED_FIELDS:
+                self._embed = None
+        super().__setattr__(name, value)
+
+    def take_changes(self) -> set[str]:
+        changed, self.changed = self.changed, set()
+        return changed
 
     @classmethod
     def from_message(cls, message: discord.Message):
@@ -74,16 +157,43 @@ class Announcement:
             channel=message.channel,
         )
 
-    def embed(self) -> discord.Embed:
-        e = discord.Embed(
-            title=self.title or None,
-            description=self.description or None,
-            url=self.url,
-            color=EMBED_COLOR,
+    def to_record(self) -> dict:
+        record = {field: getattr(self, field) for field in self.RECORD_FIELDS}
+        record["channel_id"] = self.channel.id if self.channel else None
+        record["ping_id"] = self.ping.id if self.ping else None
+        return record
+
+    @classmethod
+    def from_record(cls, record: dict):
+        # Channels and roles are placeholders until Builder.resolve can look them up in
+        # the guild.
+        ann = cls(**{field: record.get(field) for field in cls.RECORD_FIELDS})
+        ann.channel = (
+            discord.Object(record["channel_id"]) if record.get("channel_id") else None
         )
-        if self.image_url:
-            e.set_image(url=self.image_url)
-        return e
+        ann.ping = discord.Object(record["ping_id"]) if record.get("ping_id") else None
+        ann.take_changes()
+        return ann
+
+    def resolve(self, guild):
+        if isinstance(self.channel, discord.Object):
+            self.channel = guild.get_channel_or_thread(self.channel.id)
+        if isinstance(self.ping, discord.Object):
+            self.ping = guild.get_role(self.ping.id)
+
+    def embed(self) -> discord.Embed:
+        # Cached until one of the EMBED_FIELDS changes; callers must not modify it.
+        if self._embed is None:
+            e = discord.Embed(
+                title=self.title or None,
+                description=self.description or None,
+                url=self.url,
+                color=EMBED_COLOR,
+            )
+            if self.image_url:
+                e.set_image(url=self.image_url)
+            self._embed = e
+        return self._embed
 
     # ----------------- New helper -----------------
     @staticmethod
@@ -117,6 +227,7 @@ class TextModal(discord.ui.Modal):
         )
         self.add_item(self.input)
 
+    @metrics.timed("component TextModal")
     async def on_submit(self, interaction: discord.Interaction):
         if self.field == "description":
             setattr(
@@ -126,44 +237,74 @@ class TextModal(discord.ui.Modal):
             )
         else:
             setattr(self.builder.announcement, self.field, self.input.value)
-        self.builder.update_field_buttons()
-        await interaction.response.edit_message(
-            embed=self.builder.announcement.embed(),
-            view=self.builder.view,
-        )
+        await self.builder.refresh(interaction)
 
 # SELECTS
 class ChannelSelect(discord.ui.Select):
     def __init__(self, builder):
         self.builder = builder
-        options = [discord.SelectOption(label=name, value=str(cid)) for name, cid in CHANNEL_OPTIONS]
-        super().__init__(placeholder="Select Channel", options=options, row=0)
+        options = [
+            discord.SelectOption(label=name, value=str(cid))
+            for name, cid in builder.options.channel_options[:25]
+        ]
+        channel = builder.announcement.channel
+        super().__init__(
+            placeholder=builder.options.channel_names.get(
+                channel and channel.id, "Select Channel"
+            ),
+            options=options,
+            row=0,
+            custom_id=f"draft:{builder.draft_id}:channel",
+        )
 
+    @metrics.timed("component ChannelSelect")
     async def callback(self, interaction: discord.Interaction):
         cid = int(self.values[0])
         self.builder.announcement.channel = interaction.guild.get_channel(cid)
-        self.placeholder = next((name for name, id in CHANNEL_OPTIONS if id == cid), "Select Channel")
-        await interaction.response.edit_message(embed=self.builder.announcement.embed(), view=self.builder.view)
+        placeholder = self.builder.options.channel_names.get(cid, "Select Channel")
+        view_changed = placeholder != self.placeholder
+        self.placeholder = placeholder
+        await self.builder.refresh(interaction, view_changed=view_changed)
 
 class PingSelect(discord.ui.Select):
     def __init__(self, builder):
         self.builder = builder
-        options = [discord.SelectOption(label=name, value=str(rid)) for name, rid in PING_ROLE_OPTIONS]
-        super().__init__(placeholder="Select Ping Role", options=options, row=1)
+        options = [
+            discord.SelectOption(label=name, value=str(rid))
+            for name, rid in builder.options.ping_role_options[:25]
+        ]
+        ping = builder.announcement.ping
+        super().__init__(
+            placeholder=builder.options.ping_role_names.get(
+                ping and ping.id, "Select Ping Role"
+            ),
+            options=options,
+            row=1,
+            custom_id=f"draft:{builder.draft_id}:ping",
+        )
 
+    @metrics.timed("component PingSelect")
     async def callback(self, interaction: discord.Interaction):
         rid = int(self.values[0])
         self.builder.announcement.ping = interaction.guild.get_role(rid)
-        self.placeholder = next((name for name, id in PING_ROLE_OPTIONS if id == rid), "Select Ping Role")
-        await interaction.response.edit_message(embed=self.builder.announcement.embed(), view=self.builder.view)
+        placeholder = self.builder.options.ping_role_names.get(rid, "Select Ping Role")
+        view_changed = placeholder != self.placeholder
+        self.placeholder = placeholder
+        await self.builder.refresh(interaction, view_changed=view_changed)
 
 # FIELD BUTTON
 class FieldButton(discord.ui.Button):
     def __init__(self, builder, field, label, row, style):
-        super().__init__(label=label, row=row, style=style)
+        super().__init__(
+            label=label,
+            row=row,
+            style=style,
+            custom_id=f"draft:{builder.draft_id}:{field}",
+        )
         self.builder = builder
         self.field = field
 
+    @metrics.timed("component FieldButton")
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.send_modal(
             TextModal(self.builder, self.field, self.label, long=self.field=="description")
@@ -173,142 +314,877 @@ class FieldButton(discord.ui.Button):
 class PublishButton(discord.ui.Button):
     def __init__(self, builder):
         label = "Published: ✅" if builder.announcement.publish else "Published: ❌"
-        super().__init__(label=label, style=discord.ButtonStyle.secondary, row=3)
+        super().__init__(
+            label=label,
+            style=discord.ButtonStyle.secondary,
+            row=3,
+            custom_id=f"draft:{builder.draft_id}:publish",
+        )
         self.builder = builder
 
+    @metrics.timed("component PublishButton")
     async def callback(self, interaction: discord.Interaction):
         self.builder.announcement.publish = not self.builder.announcement.publish
         self.label = "Published: ✅" if self.builder.announcement.publish else "Published: ❌"
-        await interaction.response.edit_message(embed=self.builder.announcement.embed(), view=self.builder.view)
+        await self.builder.refresh(interaction, view_changed=True)
 
 class CancelButton(discord.ui.Button):
     def __init__(self, builder, editing=False):
-        super().__init__(label="Cancel", style=discord.ButtonStyle.danger, row=4)
+        super().__init__(
+            label="Cancel",
+            style=discord.ButtonStyle.danger,
+            row=4,
+            custom_id=f"draft:{builder.draft_id}:cancel",
+        )
         self.builder = builder
         self.editing = editing
 
+    @metrics.timed("component CancelButton")
     async def callback(self, interaction: discord.Interaction):
         await interaction.message.delete()
         msg_text = "Announcement editing cancelled." if self.editing else "Announcement creation cancelled."
         await interaction.response.send_message(msg_text, ephemeral=True)
-        self.view.stop()
+        drafts.remove(self.builder.draft_id)
 
 class PostButton(discord.ui.Button):
     def __init__(self, builder, editing=False):
         label = "Edit" if editing else "Post"
-        super().__init__(label=label, style=discord.ButtonStyle.blurple, row=4)
+        super().__init__(
+            label=label,
+            style=discord.ButtonStyle.blurple,
+            row=4,
+            custom_id=f"draft:{builder.draft_id}:post",
+        )
         self.builder = builder
         self.editing = editing
 
+    @metrics.timed("component PostButton")
     async def callback(self, interaction: discord.Interaction):
         ann = self.builder.announcement
         if not ann.channel:
             await interaction.response.send_message("Select a channel first.", ephemeral=True)
             return
 
-        if self.editing and self.builder.target:
-            msg = self.builder.target
-            await msg.edit(embed=ann.embed())
-        else:
-            msg = await ann.channel.send(embed=ann.embed())
+        # Acknowledge straight away so the API round-trips below can't miss the
+        # interaction deadline.
+        await interaction.response.defer()
 
-        if ann.publish and isinstance(ann.channel, discord.TextChannel) and ann.channel.is_news():
-            await msg.publish()
+        target = self.builder.target if self.editing else None
+        try:
+            failed = await post_announcement(
+                interaction.client, interaction.guild, ann, interaction.user.id, target
+            )
+        except discord.HTTPException as e:
+            await interaction.followup.send(
+                f"The announcement could not be posted: {e.text or e}", ephemeral=True
+            )
+            return
 
-        if ann.video_url:
-            await ann.channel.send(ann.video_url)
+        await interaction.followup.send(
+            "The announcement has been posted! \nhttps://i.postimg.cc/J48Vk8my/meme-8-1.gif"
+            if not self.editing else "Announcement edited!",
+            ephemeral=False
+        )
 
-        ping_msg = ""
-        if ann.ping:
-            ping_msg += f"{ann.ping.mention}"
-        if ann.ping_preview:
-            ping_msg += f" - {ann.ping_preview}"
-        if ping_msg:
-            await ann.channel.send(ping_msg)
+        if failed:
+            await interaction.followup.send(
+                "Some steps failed: " + ", ".join(failed) + ".", ephemeral=True
+            )
 
-        for cid in LOGGING_CHANNEL_IDS:
-            ch = self.builder.ctx.guild.get_channel(cid)
-            if ch:
-                await ch.send(embed=ann.embed())
+        drafts.remove(self.builder.draft_id)
 
-        if ann.channel.id in LEADERBOARD_CHANNEL_IDS:
-            leaderboard.record_announcement_post(interaction.user.id)
+class ScheduleButton(discord.ui.Button):
+    def __init__(self, builder):
+        super().__init__(
+            label="Schedule",
+            style=discord.ButtonStyle.secondary,
+            row=4,
+            custom_id=f"draft:{builder.draft_id}:schedule",
+        )
+        self.builder = builder
 
-        await interaction.response.send_message(
-            "The announcement has been posted! \nhttps://i.postimg.cc/J48Vk8my/meme-8-1.gif"
-            if not self.editing else "Announcement edited!",
-            ephemeral=False
+    @metrics.timed("component ScheduleButton")
+    async def callback(self, interaction: discord.Interaction):
+        if not self.builder.announcement.channel:
+            await interaction.response.send_message(
+                "Select a channel first.", ephemeral=True
+            )
+            return
+        await interaction.response.send_modal(ScheduleModal(self.builder))
+
+class ScheduleModal(discord.ui.Modal):
+    def __init__(self, builder):
+        super().__init__(title="Schedule Announcement")
+        self.builder = builder
+        self.when = discord.ui.TextInput(
+            label="When (UTC)",
+            placeholder="2025-05-01 18:00, or +90 for 90 minutes from now",
         )
+        self.add_item(self.when)
 
-        self.view.stop()
+    @metrics.timed("component ScheduleModal")
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            due = parse_when(self.when.value)
+        except (ValueError, OverflowError):
+            await interaction.response.send_message(
+                "Use `YYYY-MM-DD HH:MM` (UTC) or `+minutes`.", ephemeral=True
+            )
+            return
+
+        if due <= discord.utils.utcnow():
+            await interaction.response.send_message(
+                "That time has already passed.", ephemeral=True
+            )
+            return
+
+        post = ScheduledPost(
+            secrets.token_hex(4),
+            due.timestamp(),
+            interaction.guild.id,
+            interaction.user.id,
+            self.builder.announcement.to_record(),
+        )
+        scheduler.add(post)
+        drafts.remove(self.builder.draft_id)
+        await interaction.response.edit_message(
+            content=(
+                f"Scheduled for {discord.utils.format_dt(due)} as `{post.post_id}`."
+            ),
+            view=None,
+        )
 
 # VIEW
+FIELD_BUTTONS = [
+    ("title", "Title", 2),
+    ("description", "Description", 2),
+    ("url", "URL", 2),
+    ("image_url", "Image", 3),
+    ("video_url", "Video", 3),
+    ("ping_preview", "Ping Preview", 3),
+]
+
 class BuilderView(discord.ui.View):
+    # Persistent: drafts expire through the DraftStore instead of a view timeout.
     def __init__(self, builder, editing=False):
-        super().__init__(timeout=TIMEOUT)
+        super().__init__(timeout=None)
         self.builder = builder
         self.editing = editing
+        self.field_buttons = {}
 
         self.add_item(ChannelSelect(builder))
         self.add_item(PingSelect(builder))
-        self.update_field_buttons()
+        for field, label, row in FIELD_BUTTONS:
+            self.field_buttons[field] = FieldButton(
+                builder, field, label, row, self.field_style(field)
+            )
+            self.add_item(self.field_buttons[field])
         self.add_item(PublishButton(builder))
         self.add_item(CancelButton(builder, editing=editing))
         self.add_item(PostButton(builder, editing=editing))
+        if not editing:
+            self.add_item(ScheduleButton(builder))
 
-    def update_field_buttons(self):
-        field_buttons = [item for item in self.children if isinstance(item, FieldButton)]
-        for btn in field_buttons:
-            self.remove_item(btn)
-
-        for field, label, row, long in [
-            ("title", "Title", 2, False),
-            ("description", "Description", 2, True),
-            ("url", "URL", 2, False),
-            ("image_url", "Image", 3, False),
-            ("video_url", "Video", 3, False),
-            ("ping_preview", "Ping Preview", 3, False),
-        ]:
-            style = discord.ButtonStyle.success if getattr(self.builder.announcement, field) else discord.ButtonStyle.gray
-            self.add_item(FieldButton(self.builder, field, label, row, style))
+    def field_style(self, field):
+        return (
+            discord.ButtonStyle.success
+            if getattr(self.builder.announcement, field)
+            else discord.ButtonStyle.gray
+        )
+
+    def update_field_buttons(self, fields=None):
+        # Restyles only the buttons for the given fields; returns whether any of them
+        # changed.
+        changed = False
+        for field in (
+            self.field_buttons.keys()
+            if fields is None
+            else fields & self.field_buttons.keys()
+        ):
+            style = self.field_style(field)
+            if self.field_buttons[field].style != style:
+                self.field_buttons[field].style = style
+                changed = True
+        return changed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.builder.expired():
+            drafts.remove(self.builder.draft_id)
+            await interaction.response.send_message(
+                "This draft has expired.", ephemeral=True
+            )
+            return False
+
+        self.builder.resolve(interaction.guild)
+        drafts.touch(self.builder)
+        return True
 
 # BUILDER
 class Builder:
-    def __init__(self, ctx, announcement, target=None, editing=False):
-        self.ctx = ctx
+    # One per draft; kept small because the DraftStore holds up to MAX_DRAFTS of them.
+    __slots__ = (
+        "draft_id",
+        "guild_id",
+        "options",
+        "announcement",
+        "target",
+        "editing",
+        "message_id",
+        "updated_at",
+        "view",
+    )
+
+    def __init__(
+        self, guild_id, options, announcement, target=None, editing=False, draft_id=None
+    ):
+        self.draft_id = draft_id or secrets.token_hex(6)
+        self.guild_id = guild_id
+        self.options = options
         self.announcement = announcement
         self.target = target
         self.editing = editing
+        self.message_id = None
+        self.updated_at = time.time()
         self.view = BuilderView(self, editing=editing)
 
-    def update_field_buttons(self):
-        self.view.update_field_buttons()
+    def to_record(self) -> dict:
+        return {
+            "draft_id": self.draft_id,
+            "guild_id": self.guild_id,
+            "message_id": self.message_id,
+            "editing": self.editing,
+            "target_id": self.target.id if self.target else None,
+            "updated_at": self.updated_at,
+            "announcement": self.announcement.to_record(),
+        }
+
+    @classmethod
+    def from_record(cls, record: dict, config):
+        target = (
+            discord.Object(record["target_id"]) if record.get("target_id") else None
+        )
+        builder = cls(
+            record.get("guild_id"),
+            guild_options(config, record.get("guild_id")),
+            Announcement.from_record(record["announcement"]),
+            target=target,
+            editing=record["editing"],
+            draft_id=record["draft_id"],
+        )
+        builder.message_id = record["message_id"]
+        builder.updated_at = record["updated_at"]
+        return builder
+
+    def expired(self) -> bool:
+        return time.time() - self.updated_at > DRAFT_TTL
+
+    def resolve(self, guild):
+        # Restored drafts only hold ids until an interaction gives us a guild to look
+        # them up in.
+        ann = self.announcement
+        ann.resolve(guild)
+        if isinstance(self.target, discord.Object) and ann.channel:
+            self.target = ann.channel.get_partial_message(self.target.id)
+
+    async def refresh(self, interaction, view_changed=False):
+        # Only send the parts that changed, and just acknowledge interactions that
+        # changed nothing.
+        changes = self.announcement.take_changes()
+        kwargs = {}
+        if changes & Announcement.EMBED_FIELDS:
+            kwargs["embed"] = self.announcement.embed()
+        if self.view.update_field_buttons(changes) or view_changed:
+            kwargs["view"] = self.view
+
+        if kwargs:
+            await interaction.response.edit_message(**kwargs)
+        else:
+            await interaction.response.defer()
+
+    async def start(self, ctx):
+        message = await ctx.send(embed=self.announcement.embed(), view=self.view)
+        self.message_id = message.id
+        drafts.add(self)
 
-    async def start(self):
-        await self.ctx.send(embed=self.announcement.embed(), view=self.view)
+# DRAFTS
+class DraftStore(WriteBehind):
+    # LRU of open drafts, written to disk shortly after each change so they survive
+    # restarts.
+    def __init__(self, filepath=DRAFTS_FILE, limit=MAX_DRAFTS):
+        super().__init__()
+        self.filepath = filepath
+        self.limit = limit
+        self.drafts = OrderedDict()
+        self.dirty = False
+
+    def load(self, config) -> list[Builder]:
+        if not os.path.exists(self.filepath):
+            return []
+
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except ValueError as e:
+            print(f"Could not read {self.filepath}, starting without saved drafts: {e}")
+            return []
+
+        for record in records[-self.limit :]:
+            builder = Builder.from_record(record, config)
+            if not builder.expired():
+                self.drafts[builder.draft_id] = builder
+        return list(self.drafts.values())
+
+    def add(self, builder):
+        self.drafts[builder.draft_id] = builder
+        self.touch(builder)
+
+        while len(self.drafts) > self.limit:
+            _, oldest = self.drafts.popitem(last=False)
+            oldest.view.stop()
+
+        while self.drafts:
+            oldest = next(iter(self.drafts.values()))
+            if not oldest.expired():
+                break
+            self.remove(oldest.draft_id)
+
+    def touch(self, builder):
+        builder.updated_at = time.time()
+        self.drafts.move_to_end(builder.draft_id)
+        self.dirty = True
+        self.schedule_flush()
+
+    def remove(self, draft_id):
+        builder = self.drafts.pop(draft_id, None)
+        if builder is not None:
+            builder.view.stop()
+            self.dirty = True
+            self.schedule_flush()
+
+    def _take_pending(self):
+        if not self.dirty:
+            return None
+
+        self.dirty = False
+        return [builder.to_record() for builder in self.drafts.values()]
+
+    def _write(self, records):
+        write_json(self.filepath, records)
+
+drafts = DraftStore()
+
+# SCHEDULE
+class ScheduledPost:
+    __slots__ = ("post_id", "due", "guild_id", "author_id", "announcement")
+
+    def __init__(self, post_id, due, guild_id, author_id, announcement):
+        self.post_id = post_id
+        self.due = due
+        self.guild_id = guild_id
+        self.author_id = author_id
+        # Kept as a record; it is only turned back into an Announcement when it is
+        # posted.
+        self.announcement = announcement
+
+    def to_record(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+class Scheduler(WriteBehind):
+    # One task sleeps until the earliest due post, however many are queued.
+    def __init__(self, filepath=SCHEDULE_FILE):
+        super().__init__()
+        self.filepath = filepath
+        self.posts = {}
+        self.queue = []
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.inflight = set()
+        self.bot = None
+        self.dirty = False
+
+    def load(self):
+        if not os.path.exists(self.filepath):
+            return
+
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except ValueError as e:
+            print(
+                f"Could not read {self.filepath}, starting without scheduled posts: {e}"
+            )
+            return
+
+        for record in records:
+            post = ScheduledPost(**record)
+            self.posts[post.post_id] = post
+            self.queue.append((post.due, post.post_id))
+        heapq.heapify(self.queue)
+
+    def start(self, bot):
+        self.bot = bot
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await super().close()
+
+    def add(self, post):
+        self.posts[post.post_id] = post
+        heapq.heappush(self.queue, (post.due, post.post_id))
+        self._changed()
+        self.wakeup.set()
+
+    def cancel(self, post_id) -> bool:
+        # The queue entry stays behind and is skipped once it comes up.
+        if self.posts.pop(post_id, None) is None:
+            return False
+        self._changed()
+        return True
+
+    def upcoming(self, guild_id):
+        return sorted(
+            (post for post in self.posts.values() if post.guild_id == guild_id),
+            key=lambda post: post.due,
+        )
+
+    def _changed(self):
+        self.dirty = True
+        self.schedule_flush()
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            while self.queue and self.queue[0][1] not in self.posts:
+                heapq.heappop(self.queue)
+
+            if not self.queue:
+                await self.wakeup.wait()
+            else:
+                delay = self.queue[0][0] - time.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+
+            self.wakeup.clear()
+
+            now = time.time()
+            while self.queue and self.queue[0][0] <= now:
+                _, post_id = heapq.heappop(self.queue)
+                # Removed before posting, so a crash mid-post can't post it twice after
+                # a restart.
+                post = self.posts.pop(post_id, None)
+                if post is None:
+                    continue
+
+                self._changed()
+                task = asyncio.create_task(self._post(post))
+                self.inflight.add(task)
+                task.add_done_callback(self.inflight.discard)
+
+    async def _post(self, post):
+        guild = self.bot.get_guild(post.guild_id)
+        ann = Announcement.from_record(post.announcement)
+        if guild is not None:
+            ann.resolve(guild)
+        if not isinstance(ann.channel, discord.abc.Messageable):
+            print(
+                f"Scheduled announcement {post.post_id} was dropped: "
+                "its channel no longer exists."
+            )
+            return
+
+        try:
+            failed = await post_announcement(self.bot, guild, ann, post.author_id)
+        except discord.HTTPException as e:
+            print(f"Scheduled announcement {post.post_id} could not be posted: {e}")
+            return
+
+        if failed:
+            print(
+                f"Scheduled announcement {post.post_id} was posted, "
+                f"but some steps failed: {', '.join(failed)}."
+            )
+
+    def _take_pending(self):
+        if not self.dirty:
+            return None
+
+        self.dirty = False
+        return [post.to_record() for post in self.posts.values()]
+
+    def _write(self, records):
+        write_json(self.filepath, records)
+
+scheduler = Scheduler()
+
+# POSTED CACHE
+class PostedCache(WriteBehind):
+    # Full state of recently posted announcements by message id, so edits need no fetch
+    # and keep the video and ping that only exist in the messages after the embed.
+    def __init__(
+        self, filepath=POSTED_CACHE_FILE, limit=POSTED_CACHE_SIZE, ttl=POSTED_CACHE_TTL
+    ):
+        super().__init__()
+        self.filepath = filepath
+        self.limit = limit
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.dirty = False
+
+    def load(self):
+        if not self.filepath or not os.path.exists(self.filepath):
+            return
+
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except ValueError as e:
+            print(
+                f"Could not read {self.filepath}, "
+                f"starting with an empty posted cache: {e}"
+            )
+            return
+
+        now = time.time()
+        for entry in entries[-self.limit :]:
+            if now - entry["cached_at"] <= self.ttl:
+                self.entries[entry["message_id"]] = entry
+
+    def get(self, message_id):
+        entry = self.entries.get(message_id)
+        if entry is None:
+            return None
+
+        if time.time() - entry["cached_at"] > self.ttl:
+            del self.entries[message_id]
+            self._changed()
+            return None
+
+        self.entries.move_to_end(message_id)
+        return entry
+
+    def put(self, message_id, guild_id, ann: Announcement):
+        self.entries[message_id] = {
+            "message_id": message_id,
+            "guild_id": guild_id,
+            "cached_at": time.time(),
+            "announcement": ann.to_record(),
+        }
+        self.entries.move_to_end(message_id)
+
+        while len(self.entries) > self.limit:
+            self.entries.popitem(last=False)
+        self._changed()
+
+    def announcement(self, message_id, guild):
+        entry = self.get(message_id)
+        if entry is None or entry["guild_id"] != guild.id:
+            return None
+
+        ann = Announcement.from_record(entry["announcement"])
+        ann.resolve(guild)
+        # It was published already if it was meant to be; switching it on again
+        # publishes the edit.
+        ann.publish = False
+        ann.take_changes()
+        return ann
+
+    def _changed(self):
+        self.dirty = True
+        self.schedule_flush()
+
+    def _take_pending(self):
+        if not self.dirty or not self.filepath:
+            return None
+
+        self.dirty = False
+        return list(self.entries.values())
+
+    def _write(self, entries):
+        write_json(self.filepath, entries)
+
+posted = PostedCache()
+
+# SEARCH
+index = AnnouncementIndex()
+
+class SearchSelect(discord.ui.Select):
+    def __init__(self, hits):
+        self.hits = {str(hit.message_id): hit for hit in hits}
+        options = [
+            discord.SelectOption(
+                label=(hit.title or "Untitled")[:100],
+                description=datetime.fromtimestamp(
+                    hit.posted_at, timezone.utc
+                ).strftime("%Y-%m-%d %H:%M UTC"),
+                value=str(hit.message_id),
+            )
+            for hit in hits
+        ]
+        super().__init__(placeholder="Edit an announcement", options=options)
+
+    @metrics.timed("component SearchSelect")
+    async def callback(self, interaction: discord.Interaction):
+        # The index has everything the Builder needs, so the message is not fetched.
+        hit = self.hits[self.values[0]]
+        channel = interaction.guild.get_channel_or_thread(hit.channel_id)
+        if channel is None:
+            await interaction.response.send_message(
+                "That announcement's channel no longer exists.", ephemeral=True
+            )
+            return
+
+        ann = posted.announcement(hit.message_id, interaction.guild) or Announcement(
+            title=hit.title,
+            description=hit.description,
+            url=hit.url,
+            image_url=hit.image_url,
+            channel=channel,
+        )
+        target = channel.get_partial_message(hit.message_id)
+        options = guild_options(interaction.client.config, interaction.guild.id)
+        await interaction.response.edit_message(view=None)
+        self.view.stop()
+        await Builder(
+            interaction.guild.id, options, ann, target=target, editing=True
+        ).start(self.view.ctx)
+
+
+class SearchView(discord.ui.View):
+    def __init__(self, ctx, hits):
+        super().__init__(timeout=180)
+        self.ctx = ctx
+        self.add_item(SearchSelect(hits))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.ctx.author.id
+
+# POSTING
+async def post_announcement(bot, guild, ann: Announcement, author_id, target=None):
+    # Sends (or edits) the embed and then runs the follow-up steps; returns the names of
+    # failed steps.
+    dispatcher = bot.dispatcher
+    embed = ann.embed()
+    if target:
+        msg = target
+        await dispatcher.submit(
+            ("message", msg.channel.id), lambda: msg.edit(embed=embed)
+        )
+    else:
+        msg = await dispatcher.submit(
+            ("message", ann.channel.id), lambda: ann.channel.send(embed=embed)
+        )
+
+    # Everything after the embed is independent, except that the video goes before the
+    # ping.
+    steps = {}
+    if (
+        ann.publish
+        and isinstance(ann.channel, discord.TextChannel)
+        and ann.channel.is_news()
+    ):
+        steps["publishing"] = dispatcher.submit(
+            ("crosspost", ann.channel.id), msg.publish
+        )
+
+    # Edits only change the embed; the video and ping went out with the original post.
+    if not target and (ann.video_url or ann.ping or ann.ping_preview):
+        steps["video/ping messages"] = send_extras(dispatcher, ann)
+
+    posted.put(msg.id, guild.id, ann)
+
+    steps["search index"] = index.record(
+        IndexedAnnouncement(
+            msg.id,
+            guild.id,
+            ann.channel.id,
+            author_id,
+            discord.utils.snowflake_time(msg.id).timestamp(),
+            ann.title or "",
+            ann.description or "",
+            ann.url,
+            ann.image_url,
+        )
+    )
+
+    options = guild_options(bot.config, guild.id)
+    for cid in options.logging_channels:
+        ch = guild.get_channel(cid)
+        if ch:
+            steps[f"log copy to {ch.mention}"] = dispatcher.submit(
+                ("message", ch.id),
+                lambda ch=ch: ch.send(embed=embed),
+                priority=PRIORITY_LOG,
+            )
+
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    failed = [
+        step for step, result in zip(steps, results) if isinstance(result, Exception)
+    ]
+
+    if ann.channel.id in options.leaderboard_channels:
+        leaderboard.record_announcement_post(bot.config, guild.id, author_id)
+
+    return failed
+
+async def send_extras(dispatcher, ann: Announcement):
+    route = ("message", ann.channel.id)
+    if ann.video_url:
+        await dispatcher.submit(route, lambda: ann.channel.send(ann.video_url))
+
+    ping_msg = ""
+    if ann.ping:
+        ping_msg += f"{ann.ping.mention}"
+    if ann.ping_preview:
+        ping_msg += f" - {ann.ping_preview}"
+    if ping_msg:
+        await dispatcher.submit(
+            route, lambda: ann.channel.send(ping_msg), priority=PRIORITY_PING
+        )
+
+
+# HELPER
+def guild_options(config, guild_id):
+    return config.guilds.get(guild_id, DEFAULT_GUILD_OPTIONS)
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def parse_when(text, now=None):
+    # "YYYY-MM-DD HH:MM" in UTC, or "+N" for N minutes from now.
+    text = text.strip()
+    if text.startswith("+"):
+        return (now or discord.utils.utcnow()) + timedelta(minutes=float(text[1:]))
+    return datetime.strptime(text, "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
 
 # COG
 class Announcements(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_unload(self):
+        await drafts.close()
+        await scheduler.close()
+        await posted.close()
+        index.close()
+
     @commands.group(invoke_without_command=True)
+    @commands.guild_only()
     async def embed(self, ctx):
         await ctx.send_help(ctx.command)
 
     @embed.command()
     async def create(self, ctx):
-        await Builder(ctx, Announcement(channel=ctx.channel)).start()
+        options = guild_options(ctx.bot.config, ctx.guild.id)
+        await Builder(ctx.guild.id, options, Announcement(channel=ctx.channel)).start(
+            ctx
+        )
 
     @embed.command()
-    async def edit(self, ctx, message: discord.Message):
-        if not message.embeds:
-            await ctx.reply("That message has no embed.")
+    async def edit(self, ctx, message: discord.PartialMessage):
+        # Announcements the bot posted recently open from the cache; anything else is
+        # fetched.
+        ann = posted.announcement(message.id, ctx.guild)
+        if ann is None:
+            try:
+                message = await message.fetch()
+            except discord.HTTPException:
+                await ctx.reply("That message could not be found.")
+                return
+            if not message.embeds:
+                await ctx.reply("That message has no embed.")
+                return
+            ann = Announcement.from_message(message)
+
+        options = guild_options(ctx.bot.config, ctx.guild.id)
+        await Builder(ctx.guild.id, options, ann, target=message, editing=True).start(
+            ctx
+        )
+
+    @embed.command()
+    async def search(self, ctx, *, terms: str):
+        hits = await index.search(ctx.guild.id, terms)
+        if not hits:
+            await ctx.reply("No announcements match that search.", mention_author=False)
             return
-        await Builder(ctx, Announcement.from_message(message), target=message, editing=True).start()
+
+        embed = discord.Embed(title=f"Search: {terms}"[:256], color=EMBED_COLOR)
+        for hit in hits:
+            link = (
+                f"https://discord.com/channels/"
+                f"{hit.guild_id}/{hit.channel_id}/{hit.message_id}"
+            )
+            embed.add_field(
+                name=(hit.title or "Untitled")[:256],
+                value=(
+                    f"<#{hit.channel_id}> · <t:{int(hit.posted_at)}:d> · [Jump]({link})"
+                ),
+                inline=False,
+            )
+        await ctx.reply(embed=embed, view=SearchView(ctx, hits), mention_author=False)
+
+    @embed.group(invoke_without_command=True)
+    @commands.guild_only()
+    async def scheduled(self, ctx):
+        posts = scheduler.upcoming(ctx.guild.id)
+        if not posts:
+            await ctx.reply("Nothing is scheduled.", mention_author=False)
+            return
+
+        lines = []
+        for post in posts:
+            due = datetime.fromtimestamp(post.due, timezone.utc)
+            channel_id = post.announcement["channel_id"]
+            title = post.announcement["title"] or "Untitled"
+            lines.append(
+                f"`{post.post_id}` {discord.utils.format_dt(due)} "
+                f"({discord.utils.format_dt(due, 'R')}) "
+                f"in <#{channel_id}>: {title}"
+            )
+
+        embed = discord.Embed(
+            title=f"Scheduled Announcements ({len(posts)})", color=EMBED_COLOR
+        )
+        embed.description = "\n".join(lines)[:4096]
+        await ctx.reply(embed=embed, mention_author=False)
+
+    @scheduled.command(name="cancel")
+    @commands.guild_only()
+    async def scheduled_cancel(self, ctx, post_id: str):
+        post = scheduler.posts.get(post_id)
+        if post is None or post.guild_id != ctx.guild.id:
+            await ctx.reply(
+                "No scheduled announcement has that id.", mention_author=False
+            )
+            return
+
+        scheduler.cancel(post_id)
+        await ctx.reply(
+            f"Cancelled scheduled announcement `{post_id}`.", mention_author=False
+        )
+
 
 # SETUP
 async def setup(bot: commands.Bot):
+    # Runs inside setup_hook, so saved drafts are listening again before the first
+    # interaction.
+    for builder in drafts.load(bot.config):
+        bot.add_view(builder.view, message_id=builder.message_id)
+    scheduler.load()
+    scheduler.start(bot)
+    posted.load()
+    index.open()
     await bot.add_cog(Announcements(bot))
 
 
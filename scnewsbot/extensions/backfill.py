@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import discord
+from discord.ext import commands
+from extensions import announcements, leaderboard
+from search import indexed_from_message
+
+# CONFIG
+CHECKPOINT_FILE = "backfill-{guild_id}.json"
+CHECKPOINT_EVERY = 500
+PAGE_SIZE = 100
+# A post recorded live lands within a few seconds of its message, so history inside this
+# window of an existing post by the same editor is that post.
+MATCH_WINDOW = 120
+COUNTED_TYPES = (discord.MessageType.default, discord.MessageType.reply)
+
+
+# CHECKPOINT
+class BackfillState:
+
+    # Progress of one guild's backfill; saved as it goes so a restart resumes there.
+    def __init__(self, guild_id):
+        self.path = CHECKPOINT_FILE.format(guild_id=guild_id)
+        self.data = None
+        self.unsaved = 0
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        return self.data
+
+    def start(self, channel_ids):
+        # History newer than this is recorded live, so the scan stops there.
+        self.data = {
+            "before": discord.utils.time_snowflake(discord.utils.utcnow()),
+            "channels": {
+                str(cid): {"cursor": None, "done": False, "scanned": 0}
+                for cid in channel_ids
+            },
+            "posts": {},
+            "unattributed": 0,
+            "finished": False,
+            "inserted": 0,
+            "already_recorded": 0,
+        }
+
+    async def save(self):
+        # Serialized on the loop so the channel scans can't change it mid-write.
+        payload = json.dumps(self.data)
+        self.unsaved = 0
+        await asyncio.to_thread(self._write, payload)
+
+    def _write(self, payload):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.data = None
+
+
+# BACKFILL
+class Backfill:
+
+    def __init__(self, bot, guild):
+        self.bot = bot
+        self.guild = guild
+        self.state = BackfillState(guild.id)
+
+    async def run(self):
+        data = self.state.data
+        channels = [
+            channel
+            for cid, progress in data["channels"].items()
+            if not progress["done"] and (channel := self.guild.get_channel(int(cid)))
+        ]
+
+        # If one scan fails the group cancels the rest, so nothing keeps writing the
+        # checkpoint once the command has reported the failure.
+        try:
+            async with asyncio.TaskGroup() as group:
+                for channel in channels:
+                    group.create_task(self.scan(channel))
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+
+        await self.insert()
+
+    async def scan(self, channel):
+        progress = self.state.data["channels"][str(channel.id)]
+        before = discord.Object(progress["cursor"] or self.state.data["before"])
+
+        page = []
+        async for message in channel.history(limit=None, before=before):
+            page.append(message)
+            if len(page) == PAGE_SIZE:
+                await self.process(page, progress)
+                page = []
+
+        if page:
+            await self.process(page, progress)
+
+        progress["done"] = True
+        await self.state.save()
+
+    async def process(self, page, progress):
+        data = self.state.data
+        own = [m for m in page if m.author.id == self.bot.user.id and m.embeds]
+        authors = await announcements.index.authors([m.id for m in own])
+
+        for message in page:
+            if str(message.id) in data["posts"]:
+                continue
+
+            if message.author.id == self.bot.user.id:
+                if not message.embeds:
+                    # Video and ping messages that follow an embed.
+                    continue
+                uid = authors.get(message.id)
+                if uid is None:
+                    data["unattributed"] += 1
+                    continue
+            elif message.author.bot or message.type not in COUNTED_TYPES:
+                continue
+            else:
+                uid = message.author.id
+
+            ts = message.created_at.replace(tzinfo=None).isoformat()
+            data["posts"][str(message.id)] = [str(uid), ts]
+
+        # Bot posts go into the search index too, with the editor where it is known.
+        await announcements.index.record(
+            *(indexed_from_message(m, authors.get(m.id, 0)) for m in own)
+        )
+
+        progress["cursor"] = page[-1].id
+        progress["scanned"] += len(page)
+        self.state.unsaved += len(page)
+        if self.state.unsaved >= CHECKPOINT_EVERY:
+            await self.state.save()
+
+    async def insert(self):
+        data = self.state.data
+        leaderboard_data = leaderboard.leaderboard_for(self.bot.config, self.guild.id)
+
+        # Checked in one batch on a worker thread, since a history can run to many thousands
+        # of posts.
+        posts = [(uid, ts) for uid, ts in data["posts"].values()]
+        recorded = await leaderboard_data.has_posts_near(posts, MATCH_WINDOW)
+        rows = [post for post, near in zip(posts, recorded) if not near]
+        data["already_recorded"] += len(posts) - len(rows)
+
+        rows.sort(key=lambda row: row[1])
+        await leaderboard_data.import_posts(rows)
+
+        data["inserted"] = len(rows)
+        data["finished"] = True
+        await self.state.save()
+
+    def summary(self):
+        data = self.state.data
+        lines = [
+            f"<#{cid}>: {progress['scanned']} messages scanned"
+            + ("" if progress["done"] else " (in progress)")
+            for cid, progress in data["channels"].items()
+        ]
+        lines += [
+            "",
+            f"**Posts found:** {len(data['posts'])}",
+            f"**Bot posts with no known editor:** {data['unattributed']}",
+            f"**Already on the leaderboard:** {data['already_recorded']}",
+            (
+                f"**Inserted:** {data['inserted']}"
+                if data["finished"]
+                else "**Inserted:** not yet"
+            ),
+        ]
+        return "\n".join(lines)
+
+
+# COG
+class BackfillCog(commands.Cog, name="Backfill"):
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.running = {}
+
+    async def cog_check(self, ctx):
+        return ctx.guild is not None and await self.bot.is_owner(ctx.author)
+
+    async def cog_unload(self):
+        # Checkpoints are saved as the scan goes, so the next run picks up from there.
+        for _, task in self.running.values():
+            task.cancel()
+
+    @commands.group(invoke_without_command=True)
+    async def backfill(self, ctx):
+        if ctx.guild.id in self.running:
+            await ctx.reply("A backfill is already running here.", mention_author=False)
+            return
+
+        backfill = Backfill(self.bot, ctx.guild)
+        state = await asyncio.to_thread(backfill.state.load)
+
+        if state and state["finished"]:
+            await ctx.reply(
+                "The backfill has already finished. "
+                "Use `backfill reset` to allow another run.",
+                mention_author=False,
+            )
+            return
+
+        if state is None:
+            backfill.state.start(
+                announcements.guild_options(
+                    self.bot.config, ctx.guild.id
+                ).leaderboard_channels
+            )
+            await ctx.reply(
+                "Backfilling the leaderboard from channel history...",
+                mention_author=False,
+            )
+        else:
+            await ctx.reply(
+                "Resuming the leaderboard backfill...", mention_author=False
+            )
+
+        task = asyncio.create_task(backfill.run())
+        self.running[ctx.guild.id] = (backfill, task)
+        try:
+            await task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await ctx.reply(
+                f"The backfill stopped: {e}. Run `backfill` again to resume.",
+                mention_author=False,
+            )
+            return
+        finally:
+            del self.running[ctx.guild.id]
+
+        embed = discord.Embed(
+            title="Backfill Finished",
+            description=backfill.summary(),
+            color=leaderboard.EMBED_COLOR,
+        )
+        await ctx.reply(embed=embed, mention_author=False)
+
+    @backfill.command(name="status")
+    async def backfill_status(self, ctx):
+        if ctx.guild.id in self.running:
+            backfill, _ = self.running[ctx.guild.id]
+        else:
+            backfill = Backfill(self.bot, ctx.guild)
+
+        if not backfill.state.data and not await asyncio.to_thread(backfill.state.load):
+            await ctx.reply("No backfill has been started here.", mention_author=False)
+            return
+
+        embed = discord.Embed(
+            title="Backfill Status",
+            description=backfill.summary(),
+            color=leaderboard.EMBED_COLOR,
+        )
+        await ctx.reply(embed=embed, mention_author=False)
+
+    @backfill.command(name="reset")
+    async def backfill_reset(self, ctx):
+        if ctx.guild.id in self.running:
+            await ctx.reply(
+                "Wait for the running backfill to finish first.", mention_author=False
+            )
+            return
+
+        BackfillState(ctx.guild.id).reset()
+        await ctx.reply(
+            "The backfill checkpoint has been cleared.", mention_author=False
+        )
+
+
+# SETUP
+async def setup(bot):
+    await bot.add_cog(BackfillCog(bot))
@@ -1,21 +1,68 @@
 import discord
 from discord.ext import commands
 from datetime import datetime, timedelta
+import asyncio
+import functools
+import itertools
 import json
 import os
+import sqlite3
+import threading
+import numpy as np
+from sortedcontainers import SortedList
+from metrics import metrics
+from writebehind import WriteBehind
 
 # CONFIG
+LEADERBOARD_NAME = "leaderboard"
 LEADERBOARD_FILE = "leaderboard.json"
+DATABASE_FILE = "leaderboard.db"
+# Snapshot key for the last journal entry it contains; user ids are numeric, so it can't
+# clash.
+JOURNAL_SEQ_KEY = "journal_seq"
+# Snapshot key for the last roll-up batch written to the archive.
+ARCHIVE_SEQ_KEY = "archive_seq"
+LEADERBOARD_BACKEND = os.getenv("LEADERBOARD_BACKEND", "json")
+COMPACT_EVERY = 500
+# Posts older than this (and older than the current year) are rolled up into monthly
+# counts.
+RETENTION_DAYS = max(30, int(os.getenv("LEADERBOARD_RETENTION_DAYS", "30")))
+ROLLUP_INTERVAL = 86400
 EMBED_COLOR = discord.Color.gold()
 TOP_EMOJIS = ["🥇", "🥈", "🥉"]
 USERS_PER_PAGE = 5
+PAGE_CACHE_SIZE = 64
+COLUMN_CAPACITY = 1024
+# Snapshots are rebuilt soon after the data changes, and at least this often for names
+# and rolling windows.
+SNAPSHOT_POLL = 10
+SNAPSHOT_INTERVAL = 300
+EPOCH = datetime(1970, 1, 1)
 
 # DATA
-class LeaderboardData:
-
-    def __init__(self, filepath=LEADERBOARD_FILE):
+class LeaderboardData(WriteBehind):
+
+    def __init__(self, filepath=LEADERBOARD_FILE, journal_path=None, archive_path=None):
+        super().__init__()
+        # leaderboard.json keeps its posts since the last snapshot in
+        # leaderboard.journal, and rolled-up posts in one file per month under
+        # leaderboard.archive/.
+        stem = os.path.splitext(filepath)[0]
         self.filepath = filepath
+        self.journal_path = journal_path or stem + ".journal"
+        self.archive_path = archive_path or stem + ".archive"
+        self.raw_since = None
+        self.archive_lock = asyncio.Lock()
         self.data = {}
+        self.journal_entries = 0
+        self.journal_seq = 0
+        self.archive_seq = 0
+        self.pending = []
+        self.snapshot_due = False
+        self.version = 0
+        self.ranking = SortedList()
+        self.rank_keys = {}
+        self.reset_counters()
         self.load()
 
     def load(self):
@@ -28,122 +75,1200 @@ class LeaderboardData:
         else:
             self.data = {}
 
-    def save(self):
-        with open(self.filepath, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, indent=4)
+        self.journal_seq = self.data.pop(JOURNAL_SEQ_KEY, 0)
+        self.archive_seq = self.data.pop(ARCHIVE_SEQ_KEY, 0)
+        self.reindex()
+        self.replay_journal()
 
-    # RECORD POST
-    def record_post(self, user_id: int):
+    def reindex(self):
 
-        uid = str(user_id)
-        now = datetime.utcnow().isoformat()
+        self.reset_counters()
+        self.reset_columns()
+
+        rows = []
+        rolled_through = None
+        for uid, user in self.data.items():
+            self.total_posts += user.get("count", 0)
+            index = self._user_index(uid)
+            for p in user.get("posts", []):
+                dt = datetime.fromisoformat(p)
+                self._count_post(uid, dt)
+                rows.append((_epoch(dt), index))
+
+            for month, count in user.get("months", {}).items():
+                self._count_rolled(uid, int(month[:4]), count)
+                rolled_through = max(rolled_through or month, month)
+
+        # Everything from this month on is still individual posts.
+        self.raw_since = _next_month(rolled_through) if rolled_through else None
+
+        times = np.fromiter((t for t, _ in rows), dtype=np.int64, count=len(rows))
+        users = np.fromiter(
+            (index for _, index in rows), dtype=np.int64, count=len(rows)
+        )
+        order = np.argsort(times, kind="stable")
+        self._set_columns(times[order], users[order])
+
+        self.rebuild_ranking()
+
+    def save(self, data=None):
+        tmp_path = self.filepath + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data if data is None else data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.filepath)
+
+    # JOURNAL
+    def replay_journal(self):
+
+        self.journal_entries = 0
+        snapshot_seq = self.journal_seq
+
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash mid-append can leave a partial last line.
+                    continue
+
+                # A crash after a snapshot but before the journal was emptied leaves
+                # entries it already has.
+                seq = entry.get("seq")
+                if seq is not None:
+                    if seq <= snapshot_seq:
+                        continue
+                    self.journal_seq = max(self.journal_seq, seq)
+
+                self._apply(entry["user_id"], entry["ts"])
+                self.journal_entries += 1
+
+    def _take_pending(self):
+
+        if not self.pending and not self.snapshot_due:
+            return None
+
+        entries, self.pending = self.pending, []
+        first_seq = self.journal_seq + 1
+        self.journal_seq += len(entries)
+        self.journal_entries += len(entries)
+
+        if self.journal_entries < COMPACT_EVERY and not self.snapshot_due:
+            return first_seq, entries, None
+
+        # The snapshot is copied here, on the loop, so the worker never sees it change.
+        self.journal_entries = 0
+        self.snapshot_due = False
+        snapshot = {
+            uid: {**user, "posts": list(user["posts"])}
+            for uid, user in self.data.items()
+        }
+        snapshot[JOURNAL_SEQ_KEY] = self.journal_seq
+        snapshot[ARCHIVE_SEQ_KEY] = self.archive_seq
+
+        return first_seq, entries, snapshot
+
+    def _write(self, job):
+
+        first_seq, entries, snapshot = job
+
+        if snapshot is not None:
+            # The snapshot already contains the entries, so the journal can be emptied.
+            self.save(snapshot)
+            with open(self.journal_path, "w", encoding="utf-8"):
+                pass
+            return
+
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.writelines(
+                json.dumps({"user_id": uid, "ts": ts, "seq": seq}) + "\n"
+                for seq, (uid, ts) in enumerate(entries, start=first_seq)
+            )
+            f.flush()
+            os.fsync(f.fileno())
+
+    # COUNTERS
+    def reset_counters(self):
+
+        self.user_days = {}
+        self.global_days = {}
+        self.user_years = {}
+        self.global_years = {}
+        self.total_posts = 0
+        self.expired_before = 0
+
+    def _count_post(self, uid, dt):
+
+        day = dt.toordinal()
+
+        if day >= self.expired_before:
+            days = self.user_days.setdefault(uid, {})
+            days[day] = days.get(day, 0) + 1
+            self.global_days[day] = self.global_days.get(day, 0) + 1
+
+        years = self.user_years.setdefault(uid, {})
+        years[dt.year] = years.get(dt.year, 0) + 1
+        self.global_years[dt.year] = self.global_years.get(dt.year, 0) + 1
+
+    def _count_rolled(self, uid, year, count):
+
+        years = self.user_years.setdefault(uid, {})
+        years[year] = years.get(year, 0) + count
+        self.global_years[year] = self.global_years.get(year, 0) + count
+
+    def _expire_days(self):
+
+        # Drops day buckets older than the day the 30 day cutoff falls on, and returns
+        # the posts on that day from before the cutoff, which the buckets still count.
+        cutoff = datetime.utcnow() - timedelta(days=30)
+        day = cutoff.toordinal()
+
+        if day > self.expired_before:
+            for days in [self.global_days, *self.user_days.values()]:
+                for old in [old for old in days if old < day]:
+                    del days[old]
+
+            self.expired_before = day
+
+        lo, hi = np.searchsorted(
+            self.post_times, [_epoch(datetime.fromordinal(day)), _epoch(cutoff)]
+        )
+
+        return self.post_users[lo:hi]
+
+    # COLUMNS
+    def reset_columns(self):
+
+        # Parallel, time-sorted int64 columns of every post: epoch seconds and user
+        # index.
+        self.user_ids = []
+        self.user_indexes = {}
+        self._set_columns(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    def _set_columns(self, times, users):
+
+        # The buffers are over-allocated so record_post appends in place; post_count
+        # marks the end.
+        self.post_count = len(times)
+        capacity = max(COLUMN_CAPACITY, 2 * self.post_count)
+        self._times = np.empty(capacity, dtype=np.int64)
+        self._users = np.empty(capacity, dtype=np.int64)
+        self._times[: self.post_count] = times
+        self._users[: self.post_count] = users
+
+    @property
+    def post_times(self):
+
+        return self._times[: self.post_count]
+
+    @property
+    def post_users(self):
+
+        return self._users[: self.post_count]
+
+    def _user_index(self, uid):
+
+        if uid not in self.user_indexes:
+            self.user_indexes[uid] = len(self.user_ids)
+            self.user_ids.append(uid)
+
+        return self.user_indexes[uid]
+
+    def _index_post(self, uid, dt):
+
+        t = _epoch(dt)
+        index = self._user_index(uid)
+        n = self.post_count
+
+        if n == len(self._times):
+            self._set_columns(self.post_times, self.post_users)
+
+        # New posts are stamped with the current time, so they land at the end; only a
+        # clock step backwards puts one in the middle and shifts the tail.
+        if n and t < self._times[n - 1]:
+            pos = int(np.searchsorted(self._times[:n], t, side="right"))
+            self._times[pos + 1 : n + 1] = self._times[pos:n]
+            self._users[pos + 1 : n + 1] = self._users[pos:n]
+        else:
+            pos = n
+
+        self._times[pos] = t
+        self._users[pos] = index
+        self.post_count = n + 1
+
+    # RANKING
+    def rebuild_ranking(self):
+
+        # Sorted (-count, last_post, uid) keys; a SortedList keeps each post's re-rank
+        # at O(log n).
+        self.rank_keys = {
+            uid: (-user["count"], user["last_post"], uid)
+            for uid, user in self.data.items()
+        }
+        self.ranking = SortedList(self.rank_keys.values())
+
+    def _rerank(self, uid):
+
+        old_key = self.rank_keys.get(uid)
+        if old_key is not None:
+            self.ranking.remove(old_key)
+
+        user = self.data[uid]
+        key = (-user["count"], user["last_post"], uid)
+        self.rank_keys[uid] = key
+        self.ranking.add(key)
+
+    def _apply(self, uid, ts):
 
         if uid not in self.data:
             self.data[uid] = {
                 "count": 0,
-                "last_post": now,
+                "last_post": ts,
                 "posts": []
             }
 
         self.data[uid]["count"] += 1
-        self.data[uid]["last_post"] = now
-        self.data[uid]["posts"].append(now)
+        self.data[uid]["last_post"] = ts
+        self.data[uid]["posts"].append(ts)
 
-        self.save()
+        self._rerank(uid)
+
+        dt = datetime.fromisoformat(ts)
+        self.total_posts += 1
+        self._count_post(uid, dt)
+        self._index_post(uid, dt)
+
+    # RECORD POST
+    def record_post(self, user_id: int):
+
+        uid = str(user_id)
+        now = datetime.utcnow().isoformat()
+
+        self._apply(uid, now)
+        self.pending.append((uid, now))
+        self.version += 1
+
+        self.schedule_flush()
+
+    # IMPORT POSTS
+    async def import_posts(self, rows):
+
+        # Historical (uid, ts) posts, e.g. from a backfill, saved in a single snapshot
+        # write. The lock keeps them out of the posts a roll-up is archiving.
+        async with self.archive_lock:
+            for uid, ts in rows:
+                user = self.data.setdefault(
+                    uid, {"count": 0, "last_post": ts, "posts": []}
+                )
+                user["count"] += 1
+                user["posts"].append(ts)
+                user["last_post"] = max(user["last_post"], ts)
+
+            for uid in {uid for uid, _ in rows}:
+                self.data[uid]["posts"].sort()
+
+            self.reindex()
+            self.version += 1
+            self.snapshot_due = True
+
+        await self.flush()
+
+    # ROLLUP
+    async def roll_up(self, horizon=None):
+
+        # Rolls posts before the horizon into per-month counts and moves them to the
+        # archive. The horizon never cuts into the current year or the 30 day window.
+        horizon = horizon or rollup_horizon()
+
+        if not self.post_count or self.post_times[0] >= _epoch(horizon):
+            return 0
+
+        async with self.archive_lock:
+            cutoff = horizon.isoformat()
+            archived = []
+            rolled = {}
+            for uid, user in self.data.items():
+                old = [p for p in user["posts"] if p < cutoff]
+                if not old:
+                    continue
+
+                months = dict(user.get("months", {}))
+                for p in old:
+                    months[p[:7]] = months.get(p[:7], 0) + 1
+                rolled[uid] = months
+                archived.extend((p, uid) for p in old)
+
+            # The archive is written before the posts leave the data, so if it fails (or
+            # a snapshot is saved meanwhile) the raw posts are still there. The batch
+            # number only moves on once it is written, so a failed roll-up reuses it.
+            await asyncio.to_thread(self._archive, archived, self.archive_seq + 1)
+            self.archive_seq += 1
+
+            # Posts recorded during the write are newer than the cutoff, so they stay.
+            for uid, months in rolled.items():
+                user = self.data[uid]
+                user["posts"] = [p for p in user["posts"] if p >= cutoff]
+                # Replaced rather than updated, since an earlier snapshot may still be
+                # writing the old one.
+                user["months"] = months
+
+            self.reindex()
+            self.version += 1
+            self.snapshot_due = True
+
+        await self.flush()
+
+        return len(archived)
+
+    def _archive_month_path(self, month):
+
+        return os.path.join(self.archive_path, f"{month}.jsonl")
+
+    def _archive(self, rows, batch):
+
+        # Rows are tagged with their roll-up batch, and a batch's rows replace any it
+        # left before. A crash before the snapshot saves the batch number means the
+        # roll-up runs again with the same number, so the archive ends up with each post
+        # once, however many share a timestamp.
+        os.makedirs(self.archive_path, exist_ok=True)
+
+        by_month = {}
+        for ts, uid in rows:
+            by_month.setdefault(ts[:7], []).append(
+                {"user_id": uid, "ts": ts, "batch": batch}
+            )
+
+        months = {
+            name[:7]
+            for name in os.listdir(self.archive_path)
+            if name.endswith(".jsonl")
+        }
+        for month in months | by_month.keys():
+            path = self._archive_month_path(month)
+            old = self._read_archive_file(path)
+            kept = [entry for entry in old if entry.get("batch") != batch]
+            if len(kept) == len(old) and month not in by_month:
+                continue
+
+            entries = sorted(
+                kept + by_month.get(month, []), key=lambda entry: entry["ts"]
+            )
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in entries)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+    def _read_archive_file(self, path):
+
+        if not os.path.exists(path):
+            return []
+
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def _read_archive(self, start, end):
+
+        # Rolled-up (uid, ts) posts in [start, end); reads files, so it belongs on a
+        # worker thread.
+        if not os.path.isdir(self.archive_path):
+            return []
+
+        first, last = _month_key(start), _month_key(end)
+        start, end = start.isoformat(), end.isoformat()
+
+        rows = []
+        for name in sorted(os.listdir(self.archive_path)):
+            if name.endswith(".jsonl") and first <= name[:7] <= last:
+                path = os.path.join(self.archive_path, name)
+                rows.extend(
+                    (entry["user_id"], entry["ts"])
+                    for entry in self._read_archive_file(path)
+                    if start <= entry["ts"] < end
+                )
+
+        return rows
+
+    async def has_posts_near(self, rows, seconds):
+
+        # Whether each (uid, ts) row has a post by the same user within seconds of it,
+        # rolled-up posts included. The columns are copied here, so the search can run
+        # on a worker thread while posts keep coming in; the lock keeps a roll-up from
+        # moving posts meanwhile.
+        async with self.archive_lock:
+            times, users = self.post_times.copy(), self.post_users.copy()
+            indexes = dict(self.user_indexes)
+
+            return await asyncio.to_thread(
+                self._has_posts_near,
+                rows,
+                seconds,
+                times,
+                users,
+                indexes,
+                self.raw_since,
+            )
+
+    def _has_posts_near(self, rows, seconds, times, users, indexes, raw_since):
+
+        if rows and raw_since is not None:
+            start = min(datetime.fromisoformat(ts) for _, ts in rows) - timedelta(
+                seconds=seconds
+            )
+            if start < raw_since:
+                archived = self._read_archive(start, raw_since)
+                times = np.concatenate(
+                    [times, [_epoch(datetime.fromisoformat(ts)) for _, ts in archived]]
+                ).astype(np.int64)
+                users = np.concatenate(
+                    [
+                        users,
+                        [indexes.setdefault(uid, len(indexes)) for uid, _ in archived],
+                    ]
+                ).astype(np.int64)
+
+        # Every post becomes one sorted (user << 32) + time key, so each row is a single
+        # range lookup; epoch seconds fit in 32 bits until 2106.
+        keys = np.sort((users << 32) + times)
+        known = np.array([uid in indexes for uid, _ in rows], dtype=bool)
+        row_keys = np.array(
+            [
+                (indexes.get(uid, 0) << 32) + _epoch(datetime.fromisoformat(ts))
+                for uid, ts in rows
+            ],
+            dtype=np.int64,
+        )
+        lo = np.searchsorted(keys, row_keys - seconds)
+        hi = np.searchsorted(keys, row_keys + seconds, side="right")
+
+        return (known & (hi > lo)).tolist()
 
     # SORT
     def get_sorted(self):
 
-        return sorted(
-            self.data.items(),
-            key=lambda item: (-item[1]["count"], item[1]["last_post"])
-        )
+        return self.page(0, len(self.ranking))
+
+    def user_count(self):
+
+        return len(self.ranking)
+
+    def page(self, start, end):
+
+        return [(uid, self.data[uid]) for _, _, uid in self.ranking.islice(start, end)]
+
+    def rank_of(self, uid):
+
+        key = self.rank_keys.get(uid)
+        if key is None:
+            return None
+
+        return self.ranking.bisect_left(key)
+
+    async def ranked_between(self, start: datetime, end: datetime):
+
+        # The lock keeps a roll-up from moving posts between the archive and the columns
+        # mid-query.
+        async with self.archive_lock:
+            archived = []
+            if self.raw_since is not None and start < self.raw_since:
+                archived = await asyncio.to_thread(
+                    self._read_archive, start, min(end, self.raw_since)
+                )
+
+            return self._rank_window(start, end, archived)
+
+    def _rank_window(self, start, end, archived):
+
+        archived = [
+            (_epoch(datetime.fromisoformat(ts)), self._user_index(uid))
+            for uid, ts in archived
+        ]
+
+        lo, hi = np.searchsorted(self.post_times, [_epoch(start), _epoch(end)])
+        times = self.post_times[lo:hi]
+        users = self.post_users[lo:hi]
+
+        if archived:
+            times = np.concatenate(
+                [np.array([t for t, _ in archived], dtype=np.int64), times]
+            )
+            users = np.concatenate(
+                [np.array([i for _, i in archived], dtype=np.int64), users]
+            )
+
+        counts = np.bincount(users, minlength=len(self.user_ids))
+        last = np.zeros(len(self.user_ids), dtype=np.int64)
+        np.maximum.at(last, users, times)
+
+        # Most posts first, then the earliest last post, like the all-time ranking.
+        ranked = np.flatnonzero(counts)
+        ranked = ranked[np.lexsort((last[ranked], -counts[ranked]))]
+
+        # Epoch seconds format as the same ISO strings as datetime.isoformat(), in one
+        # pass.
+        last_posts = last[ranked].astype("datetime64[s]").astype(str)
+
+        return [
+            (self.user_ids[index], {"count": count, "last_post": last_post})
+            for index, count, last_post in zip(
+                ranked.tolist(), counts[ranked].tolist(), last_posts.tolist()
+            )
+        ]
 
     # USER STATS
-    def user_30_days(self, posts):
+    def user_30_days(self, uid):
 
-        cutoff = datetime.utcnow() - timedelta(days=30)
+        before_cutoff = self._expire_days()
+        index = self.user_indexes.get(uid)
 
-        return sum(
-            1 for p in posts
-            if datetime.fromisoformat(p) >= cutoff
+        return sum(self.user_days.get(uid, {}).values()) - int(
+            np.count_nonzero(before_cutoff == index)
         )
 
-    def user_year(self, posts):
+    def user_year(self, uid):
 
         year = datetime.utcnow().year
 
-        return sum(
-            1 for p in posts
-            if datetime.fromisoformat(p).year == year
-        )
+        return self.user_years.get(uid, {}).get(year, 0)
 
     # GLOBAL STATS
     def global_stats(self):
 
-        cutoff = datetime.utcnow() - timedelta(days=30)
+        before_cutoff = self._expire_days()
         year = datetime.utcnow().year
 
-        total30 = 0
-        totalYear = 0
-        totalAll = 0
+        total30 = sum(self.global_days.values()) - len(before_cutoff)
+        totalYear = self.global_years.get(year, 0)
+        totalAll = self.total_posts
+
+        return total30, totalYear, totalAll
+
+    # SNAPSHOT STATS
+    async def snapshot_stats(self):
+
+        # The loop only takes copies: rank keys are immutable tuples and the column
+        # slices are copied, so the per-user work runs on a worker thread while posts
+        # keep coming in. Roll-ups never reach into the current year, so both windows
+        # are fully in the columns.
+        now = datetime.utcnow()
+        lo30, lo_year = np.searchsorted(
+            self.post_times,
+            [_epoch(now - timedelta(days=30)), _epoch(datetime(now.year, 1, 1))],
+        )
+        job = (
+            list(self.ranking),
+            list(self.user_ids),
+            self.post_users[lo30:].copy(),
+            self.post_users[lo_year:].copy(),
+        )
+        totals = self.global_stats()
 
-        for user in self.data.values():
+        users, stats = await asyncio.to_thread(self._snapshot_stats, *job)
 
-            posts = user.get("posts", [])
+        return users, stats, totals
 
-            totalAll += user.get("count", 0)
+    @staticmethod
+    def _snapshot_stats(keys, user_ids, last30_users, year_users):
 
-            for p in posts:
+        users = [
+            (uid, {"count": -count, "last_post": last_post})
+            for count, last_post, uid in keys
+        ]
+        last30 = np.bincount(last30_users, minlength=len(user_ids)).tolist()
+        year = np.bincount(year_users, minlength=len(user_ids)).tolist()
 
-                dt = datetime.fromisoformat(p)
+        return users, dict(zip(user_ids, zip(last30, year)))
+
+
+class SqliteLeaderboardData(WriteBehind):
+
+    def __init__(self, filepath=DATABASE_FILE, import_from=LEADERBOARD_FILE):
+        super().__init__()
+        self.filepath = filepath
+        self.version = 0
+        self.pending = []
+        # Reads run on the event loop and writes on a worker thread, one at a time.
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                ts TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS posts_user_ts ON posts (user_id, ts);
+            CREATE INDEX IF NOT EXISTS posts_ts ON posts (ts);
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                last_post TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS users_rank
+                ON users (count DESC, last_post, user_id);
+            """)
+
+        if import_from and self.is_empty():
+            self.import_json(import_from)
+
+        if not self._query("SELECT 1 FROM users LIMIT 1"):
+            self.rebuild_users()
+
+    def _query(self, sql, params=()):
+
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def rebuild_users(self):
+
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM users")
+            self.conn.execute("""
+                INSERT INTO users (user_id, count, last_post)
+                SELECT user_id, COUNT(*), MAX(ts) FROM posts GROUP BY user_id
+                """)
+
+    def is_empty(self):
+
+        return not self._query("SELECT 1 FROM posts LIMIT 1")
+
+    # IMPORT
+    def import_json(self, filepath):
+
+        # Same journal and archive paths the JSON backend uses, so posts since its last
+        # snapshot come along.
+        json_data = LeaderboardData(filepath)
+
+        rows = []
+        for uid, user in json_data.data.items():
+            posts = list(user.get("posts", []))
+            rolled = sum(user.get("months", {}).values())
+            # Older entries may have a count without a matching timestamp.
+            posts += [user["last_post"]] * (user.get("count", 0) - len(posts) - rolled)
+            rows.extend((uid, ts) for ts in posts)
+
+        # Rolled-up posts are kept individually in the archive.
+        rows.extend(json_data._read_archive(datetime.min, datetime.max))
+
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO posts (user_id, ts) VALUES (?, ?)", rows)
+
+    # RECORD POST
+    def record_post(self, user_id: int):
+
+        now = datetime.utcnow().isoformat()
+
+        self.pending.append((str(user_id), now))
+        self.schedule_flush()
+
+    def _take_pending(self):
+
+        if not self.pending:
+            return None
+
+        rows, self.pending = self.pending, []
+
+        return rows
+
+    def _write(self, rows):
+
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO posts (user_id, ts) VALUES (?, ?)", rows)
+            self.conn.executemany(
+                """
+                INSERT INTO users (user_id, count, last_post) VALUES (?, 1, ?)
+                ON CONFLICT (user_id)
+                DO UPDATE SET count = count + 1, last_post = excluded.last_post
+                """,
+                rows,
+            )
+
+    def _finish_flush(self, result):
+
+        # Queued posts only become visible once committed, so the version moves then.
+        self.version += 1
+
+    # IMPORT POSTS
+    async def import_posts(self, rows):
+
+        await asyncio.to_thread(self._import_rows, rows)
+        self.version += 1
+
+    def _import_rows(self, rows):
+
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO posts (user_id, ts) VALUES (?, ?)", rows)
+            self.conn.execute("DELETE FROM users")
+            self.conn.execute("""
+                INSERT INTO users (user_id, count, last_post)
+                SELECT user_id, COUNT(*), MAX(ts) FROM posts GROUP BY user_id
+                """)
+
+    async def has_posts_near(self, rows, seconds):
+
+        return await asyncio.to_thread(self._has_posts_near, rows, seconds)
+
+    def _has_posts_near(self, rows, seconds):
+
+        window = timedelta(seconds=seconds)
+        candidates = []
+        for row_id, (uid, ts) in enumerate(rows):
+            dt = datetime.fromisoformat(ts)
+            candidates.append(
+                (row_id, uid, (dt - window).isoformat(), (dt + window).isoformat())
+            )
+
+        # One query against a temporary table rather than one per row, so the lock is
+        # taken once.
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS candidates (
+                    id INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    lo TEXT NOT NULL,
+                    hi TEXT NOT NULL
+                )
+                """)
+            self.conn.executemany(
+                "INSERT INTO temp.candidates VALUES (?, ?, ?, ?)", candidates
+            )
+            found = self.conn.execute("""
+                SELECT id FROM temp.candidates AS c
+                WHERE EXISTS (
+                    SELECT 1 FROM posts AS p
+                    WHERE p.user_id = c.user_id AND p.ts >= c.lo AND p.ts <= c.hi
+                )
+                """).fetchall()
+            self.conn.execute("DELETE FROM temp.candidates")
+
+        found = {row_id for row_id, in found}
+
+        return [row_id in found for row_id in range(len(rows))]
+
+    # SORT
+    def get_sorted(self):
+
+        return self.page(0, self.user_count())
+
+    def user_count(self):
+
+        return self._query("SELECT COUNT(*) FROM users")[0][0]
+
+    def page(self, start, end):
+
+        rows = self._query(
+            """
+            SELECT user_id, count, last_post
+            FROM users
+            ORDER BY count DESC, last_post, user_id
+            LIMIT ? OFFSET ?
+            """,
+            (end - start, start),
+        )
+
+        return [
+            (uid, {"count": count, "last_post": last_post})
+            for uid, count, last_post in rows
+        ]
+
+    def rank_of(self, uid):
+
+        rows = self._query(
+            "SELECT count, last_post FROM users WHERE user_id = ?", (uid,)
+        )
+        if not rows:
+            return None
+
+        count, last_post = rows[0]
+
+        return self._count_users(
+            """
+            count > ?
+            OR (count = ? AND last_post < ?)
+            OR (count = ? AND last_post = ? AND user_id < ?)
+            """,
+            (count, count, last_post, count, last_post, uid),
+        )
+
+    def _count_users(self, where, params):
+
+        return self._query(f"SELECT COUNT(*) FROM users WHERE {where}", params)[0][0]
+
+    async def ranked_between(self, start: datetime, end: datetime):
 
-                if dt >= cutoff:
-                    total30 += 1
+        return await asyncio.to_thread(self._ranked_between, start, end)
 
-                if dt.year == year:
-                    totalYear += 1
+    def _ranked_between(self, start, end):
+
+        rows = self._query(
+            """
+            SELECT user_id, COUNT(*) AS count, MAX(ts) AS last_post
+            FROM posts
+            WHERE ts >= ? AND ts < ?
+            GROUP BY user_id
+            ORDER BY count DESC, last_post
+            """,
+            (start.isoformat(), end.isoformat()),
+        )
+
+        return [
+            (uid, {"count": count, "last_post": last_post})
+            for uid, count, last_post in rows
+        ]
+
+    # USER STATS
+    def _count(self, where, params):
+
+        return self._query(f"SELECT COUNT(*) FROM posts WHERE {where}", params)[0][0]
+
+    def user_30_days(self, uid):
+
+        cutoff = (datetime.utcnow() - timedelta(days=30)).isoformat()
+
+        return self._count("user_id = ? AND ts >= ?", (uid, cutoff))
+
+    def user_year(self, uid):
+
+        start, end = _year_bounds()
+
+        return self._count("user_id = ? AND ts >= ? AND ts < ?", (uid, start, end))
+
+    # GLOBAL STATS
+    def global_stats(self):
+
+        cutoff = (datetime.utcnow() - timedelta(days=30)).isoformat()
+        start, end = _year_bounds()
+
+        total30 = self._count("ts >= ?", (cutoff,))
+        totalYear = self._count("ts >= ? AND ts < ?", (start, end))
+        totalAll = self._count("1", ())
 
         return total30, totalYear, totalAll
 
+    # SNAPSHOT STATS
+    async def snapshot_stats(self):
+
+        return await asyncio.to_thread(self._snapshot_stats)
+
+    def _snapshot_stats(self):
+
+        # One pass over the recent posts for every user's counts, instead of two queries
+        # per user.
+        cutoff = (datetime.utcnow() - timedelta(days=30)).isoformat()
+        start, end = _year_bounds()
+
+        with self.lock:
+            users = self.conn.execute("""
+                SELECT user_id, count, last_post
+                FROM users
+                ORDER BY count DESC, last_post, user_id
+                """).fetchall()
+            rows = self.conn.execute(
+                """
+                SELECT user_id, SUM(ts >= ?), SUM(ts >= ? AND ts < ?)
+                FROM posts
+                WHERE ts >= ?
+                GROUP BY user_id
+                """,
+                (cutoff, start, end, min(cutoff, start)),
+            ).fetchall()
+            totalAll = self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+        stats = {uid: (last30, year) for uid, last30, year in rows}
+        totals = (
+            sum(last30 for last30, _ in stats.values()),
+            sum(year for _, year in stats.values()),
+            totalAll,
+        )
+
+        return (
+            [
+                (uid, {"count": count, "last_post": last_post})
+                for uid, count, last_post in users
+            ],
+            stats,
+            totals,
+        )
+
+
+class RankedList:
+
+    # Gives a precomputed ranking the same paging interface as the leaderboard data.
+    def __init__(self, users):
+        self.users = users
+        self.ranks = {uid: index for index, (uid, _) in enumerate(users)}
+
+    def user_count(self):
+
+        return len(self.users)
+
+    def page(self, start, end):
+
+        return self.users[start:end]
+
+    def rank_of(self, uid):
+
+        return self.ranks.get(uid)
+
+
+def _epoch(dt):
+
+    return int((dt - EPOCH).total_seconds())
+
+
+def _next_month(month):
+
+    year, month = int(month[:4]), int(month[5:7])
+
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def _month_key(dt):
+
+    # Zero-padded, so it also sorts right for datetime.min.
+    return f"{dt.year:04d}-{dt.month:02d}"
+
+
+def rollup_horizon():
+
+    now = datetime.utcnow()
+    keep_from = min(now.replace(month=1, day=1), now - timedelta(days=RETENTION_DAYS))
+
+    return keep_from.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _year_bounds():
+
+    year = datetime.utcnow().year
+
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+
+def create_leaderboard_data(backend=LEADERBOARD_BACKEND, name=LEADERBOARD_NAME):
+
+    if backend == "sqlite":
+        return SqliteLeaderboardData(f"{name}.db", import_from=f"{name}.json")
+
+    return LeaderboardData(f"{name}.json")
+
+
+class LazyLeaderboardData:
+
+    # Defers reading the leaderboard until it is first used or preloaded in a thread.
+    def __init__(self, factory, name=LEADERBOARD_NAME):
+        self.factory = factory
+        self.name = name
+        self.instance = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+
+        return self.instance is not None
+
+    def load(self):
+
+        with self.lock:
+            if self.instance is None:
+                self.instance = self.factory()
+
+        return self.instance
+
+    def __getattr__(self, name):
+
+        return getattr(self.instance or self.load(), name)
+
+
+leaderboard_data = LazyLeaderboardData(create_leaderboard_data)
+leaderboards = {LEADERBOARD_NAME: leaderboard_data}
+
+
+def leaderboard_for(config, guild_id):
+
+    # Guilds without their own config table share the original leaderboard files.
+    options = config.guilds.get(guild_id)
+    name = options.leaderboard if options else LEADERBOARD_NAME
+
+    if name not in leaderboards:
+        leaderboards[name] = LazyLeaderboardData(
+            functools.partial(create_leaderboard_data, name=name), name
+        )
+
+    return leaderboards[name]
+
+
+# PAGE CACHE
+class PageCache:
+
+    # Rendered pages are shared between views; a leaderboard's pages are dropped
+    # whenever its version changes.
+    def __init__(self, max_size=PAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self.versions = {}
+        self.pages = {}
+
+    def get(self, source, key, version):
+
+        if version != self.versions.get(source):
+            self.pages = {k: page for k, page in self.pages.items() if k[0] != source}
+            self.versions[source] = version
+
+        return self.pages.get((source, *key))
+
+    def put(self, source, key, page):
+
+        if len(self.pages) >= self.max_size:
+            del self.pages[next(iter(self.pages))]
+
+        self.pages[(source, *key)] = page
+
+
+page_cache = PageCache()
+
+
+# SNAPSHOT
+_snapshot_versions = itertools.count(1)
+
+
+class LeaderboardSnapshot(RankedList):
+
+    # Everything a leaderboard page shows for one guild, built in the background and
+    # swapped in whole.
+    def __init__(self, data, guild, data_version, users, stats, totals):
+
+        super().__init__(users)
+
+        self.source = data
+        self.data_version = data_version
+        # Guilds sharing a leaderboard resolve names differently, so each gets its own
+        # pages.
+        self.name = f"{data.name}:{guild.id}"
+        self.version = next(_snapshot_versions)
+        self.taken_at = datetime.utcnow()
+        self.stats = stats
+        self.totals = totals
+        self.names = {}
+        for uid, _ in users:
+            member = guild.get_member(int(uid))
+            self.names[uid] = member.display_name if member else f"User {uid}"
+
+    @classmethod
+    async def build(cls, data, guild):
+
+        with metrics.timer("leaderboard snapshot"):
+            # Read first: anything posted while the stats are gathered leaves the
+            # snapshot stale.
+            data_version = data.version
+            users, stats, totals = await data.snapshot_stats()
+
+            # Indexing ranks and resolving names is per user too; get_member is a plain
+            # dict lookup.
+            return await asyncio.to_thread(
+                cls, data, guild, data_version, users, stats, totals
+            )
+
+    def stale(self, data):
+
+        if data is not self.source or data.version != self.data_version:
+            return True
+
+        return (datetime.utcnow() - self.taken_at).total_seconds() >= SNAPSHOT_INTERVAL
+
+    def display_name(self, uid):
+
+        return self.names.get(uid, f"User {uid}")
+
+    def user_30_days(self, uid):
+
+        return self.stats.get(uid, (0, 0))[0]
+
+    def user_year(self, uid):
+
+        return self.stats.get(uid, (0, 0))[1]
+
+    def global_stats(self):
+
+        return self.totals
+
+    def age(self):
+
+        seconds = int((datetime.utcnow() - self.taken_at).total_seconds())
+
+        if seconds < 60:
+            return "just now"
+        if seconds < 3600:
+            return f"{seconds // 60} min ago"
+
+        return f"{seconds // 3600} h ago"
 
-leaderboard_data = LeaderboardData()
 
 # VIEW
 class LeaderboardView(discord.ui.View):
 
-    def __init__(self, ctx, users):
+    def __init__(self, ctx, snapshot, ranking=None, period=None):
 
         super().__init__(timeout=180)
 
         self.ctx = ctx
-        self.users = users
+        self.data = snapshot
+        self.ranking = snapshot if ranking is None else ranking
+        self.period = period
         self.page = 0
-        self.max_page = (len(users) - 1) // USERS_PER_PAGE
+        self.max_page = (self.ranking.user_count() - 1) // USERS_PER_PAGE
 
     def build_embed(self):
 
+        key = (self.page, self.period)
+        page = page_cache.get(self.data.name, key, self.data.version)
+
+        if page is None:
+            page = self.render_page()
+            page_cache.put(self.data.name, key, page)
+
+        embed_data, page_uids, self.max_page = page
+
+        # The cached page is shared, so the viewer marker goes on a copy of the fields.
+        embed_data = {**embed_data, "fields": [dict(f) for f in embed_data["fields"]]}
+        embed_data["footer"] = {
+            "text": f"{embed_data['footer']['text']} • Updated {self.data.age()}"
+        }
+
+        viewer = str(self.ctx.author.id)
+        if viewer in page_uids:
+            embed_data["fields"][page_uids.index(viewer)]["value"] += " 👈 You"
+
+        return discord.Embed.from_dict(embed_data)
+
+    def render_page(self):
+
+        self.max_page = (self.ranking.user_count() - 1) // USERS_PER_PAGE
+
         embed = discord.Embed(
             title="📊 Announcement Leaderboard",
             color=EMBED_COLOR,
             timestamp=datetime.utcnow()
         )
 
+        if self.period:
+            embed.description = f"**Period:** {self.period}"
+
         start = self.page * USERS_PER_PAGE
         end = start + USERS_PER_PAGE
 
-        page_users = self.users[start:end]
+        page_users = self.ranking.page(start, end)
 
         for i, (uid, stats) in enumerate(page_users, start=start+1):
 
-            member = self.ctx.guild.get_member(int(uid))
-            name = member.display_name if member else f"User {uid}"
-
-            posts = stats.get("posts", [])
+            name = self.data.display_name(uid)
 
             alltime = stats["count"]
-            last30 = leaderboard_data.user_30_days(posts)
-            year = leaderboard_data.user_year(posts)
+            last30 = self.data.user_30_days(uid)
+            year = self.data.user_year(uid)
 
             last_post = datetime.fromisoformat(stats["last_post"]).strftime("%Y-%m-%d %H:%M UTC")
 
@@ -153,19 +1278,16 @@ class LeaderboardView(discord.ui.View):
                 title = name
 
             value = (
-                f"**All Time:** {alltime}\n"
+                f"**{'In Period' if self.period else 'All Time'}:** {alltime}\n"
                 f"**30 Days:** {last30}\n"
                 f"**Year:** {year}\n"
                 f"**Last:** {last_post}"
             )
 
-            if int(uid) == self.ctx.author.id:
-                value += " 👈 You"
-
             embed.add_field(name=title, value=value, inline=False)
 
         # GLOBAL STATS
-        total30, totalYear, totalAll = leaderboard_data.global_stats()
+        total30, totalYear, totalAll = self.data.global_stats()
 
         embed.add_field(
             name="📈 Server Announcement Stats",
@@ -179,10 +1301,11 @@ class LeaderboardView(discord.ui.View):
 
         embed.set_footer(text=f"Page {self.page+1}/{self.max_page+1}")
 
-        return embed
+        return embed.to_dict(), [uid for uid, _ in page_users], self.max_page
 
     # BUTTONS
     @discord.ui.button(label="⬅ Previous", style=discord.ButtonStyle.secondary)
+    @metrics.timed("component leaderboard previous")
     async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
 
         if self.page > 0:
@@ -191,20 +1314,18 @@ class LeaderboardView(discord.ui.View):
         await interaction.response.edit_message(embed=self.build_embed(), view=self)
 
     @discord.ui.button(label="🧑 My Rank", style=discord.ButtonStyle.primary)
+    @metrics.timed("component leaderboard my rank")
     async def my_rank(self, interaction: discord.Interaction, button: discord.ui.Button):
 
-        uid = str(interaction.user.id)
-
-        for index, (user_id, _) in enumerate(self.users):
-
-            if user_id == uid:
+        index = self.ranking.rank_of(str(interaction.user.id))
 
-                self.page = index // USERS_PER_PAGE
-                break
+        if index is not None:
+            self.page = index // USERS_PER_PAGE
 
         await interaction.response.edit_message(embed=self.build_embed(), view=self)
 
     @discord.ui.button(label="Next ➡", style=discord.ButtonStyle.secondary)
+    @metrics.timed("component leaderboard next")
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
 
         if self.page < self.max_page:
@@ -218,31 +1339,169 @@ class Leaderboard(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.preload = None
+        self.rollups = None
+        self.refresher = None
+        self.snapshots = {}
+
+    async def snapshot_for(self, guild):
+
+        data = leaderboard_for(self.bot.config, guild.id)
+        snapshot = self.snapshots.get(guild.id)
+
+        # Only built here before the refresher's first pass or when the guild's
+        # leaderboard changed.
+        if snapshot is None or snapshot.source is not data:
+            snapshot = self.snapshots[guild.id] = await LeaderboardSnapshot.build(
+                data, guild
+            )
+
+        return snapshot
+
+    async def refresh_snapshots(self):
+
+        if self.preload is not None:
+            await self.preload
+
+        while True:
+            for guild in self.bot.guilds:
+                data = leaderboard_for(self.bot.config, guild.id)
+                snapshot = self.snapshots.get(guild.id)
+
+                if snapshot is None or snapshot.stale(data):
+                    # A failed refresh keeps the old snapshot, and its footer shows how
+                    # old it is.
+                    try:
+                        self.snapshots[guild.id] = await LeaderboardSnapshot.build(
+                            data, guild
+                        )
+                    except Exception as e:
+                        print(
+                            "Could not refresh the leaderboard snapshot for "
+                            f"{guild.id}: {e!r}"
+                        )
+
+            await asyncio.sleep(SNAPSHOT_POLL)
+
+    async def roll_up_daily(self):
+
+        if self.preload is not None:
+            await self.preload
+
+        while True:
+            for data in list(leaderboards.values()):
+                # Only the JSON backend keeps per-user post lists; SQLite has an indexed
+                # table.
+                if not data.loaded or not isinstance(data.instance, LeaderboardData):
+                    continue
+
+                try:
+                    rolled = await data.roll_up()
+                except Exception as e:
+                    print(f"Could not roll up the {data.name} leaderboard: {e!r}")
+                    continue
+
+                if rolled:
+                    print(
+                        f"Rolled {rolled} old posts of the {data.name} leaderboard "
+                        "into monthly counts."
+                    )
 
-    @commands.command()
-    async def leaderboard(self, ctx):
+            await asyncio.sleep(ROLLUP_INTERVAL)
 
-        users = leaderboard_data.get_sorted()
+    async def cog_unload(self):
 
-        if not users:
+        for task in (self.rollups, self.refresher):
+            if task is not None:
+                task.cancel()
+
+        for data in leaderboards.values():
+            if data.loaded:
+                await data.close()
+
+    @commands.command(usage="[YYYY-MM-DD [YYYY-MM-DD] | --month | --year]")
+    @commands.guild_only()
+    async def leaderboard(self, ctx, start: str = None, end: str = None):
+
+        snapshot = await self.snapshot_for(ctx.guild)
+
+        if start is None:
+            ranking = snapshot
+            period = None
+        else:
+            try:
+                start_dt, end_dt, period = parse_period(start, end)
+            except ValueError:
+                await ctx.send(
+                    "Dates must be given as `YYYY-MM-DD`, or use `--month` or `--year`."
+                )
+                return
+
+            # Arbitrary periods can't be precomputed, but the stats beside them come
+            # from the snapshot.
+            ranking = RankedList(await snapshot.source.ranked_between(start_dt, end_dt))
+
+        if not ranking.user_count():
             await ctx.send("No announcements have been posted yet.")
             return
 
-        view = LeaderboardView(ctx, users)
+        view = LeaderboardView(ctx, snapshot, ranking, period=period)
 
         await ctx.send(embed=view.build_embed(), view=view)
 
 
 # HELPER
-def record_announcement_post(user_id: int):
+def parse_period(start, end=None):
+
+    # Returns a [start, end) datetime window and a label for it; the end date is
+    # inclusive.
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if start == "--month":
+        start_dt = today.replace(day=1)
+        return start_dt, today + timedelta(days=1), start_dt.strftime("%B %Y")
+
+    if start == "--year":
+        start_dt = today.replace(month=1, day=1)
+        return start_dt, today + timedelta(days=1), str(start_dt.year)
+
+    start_dt = datetime.strptime(start, "%Y-%m-%d")
+    end_dt = datetime.strptime(end, "%Y-%m-%d") if end else today
 
-    leaderboard_data.record_post(user_id)
+    if end_dt < start_dt:
+        raise ValueError("The end date is before the start date.")
+
+    label = f"{start_dt:%Y-%m-%d} → {end_dt:%Y-%m-%d}"
+
+    return start_dt, end_dt + timedelta(days=1), label
+
+
+def record_announcement_post(config, guild_id: int, user_id: int):
+
+    leaderboard_for(config, guild_id).record_post(user_id)
 
 
 # SETUP
 async def setup(bot):
 
-    await bot.add_cog(Leaderboard(bot))
+    cog = Leaderboard(bot)
+    await bot.add_cog(cog)
+
+    preload = {LEADERBOARD_NAME: leaderboard_data}
+    for guild_id in bot.config.guilds:
+        data = leaderboard_for(bot.config, guild_id)
+        preload[data.name] = data
+
+    if bot.config.fast_startup:
+        cog.preload = asyncio.gather(
+            *(asyncio.to_thread(data.load) for data in preload.values())
+        )
+    else:
+        for data in preload.values():
+            data.load()
+
+    cog.rollups = asyncio.create_task(cog.roll_up_daily())
+    cog.refresher = asyncio.create_task(cog.refresh_snapshots())
 
 
 
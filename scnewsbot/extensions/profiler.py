@@ -0,0 +1,195 @@
+import asyncio
+import cProfile
+import io
+import linecache
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+import discord
+from discord.ext import commands
+
+# CONFIG
+DEFAULT_SECONDS = 10
+MAX_SECONDS = 300
+SAMPLE_INTERVAL = 0.005
+TOP_ENTRIES = 40
+TRACEMALLOC_FRAMES = 10
+
+
+# CAPTURES
+# Nothing here runs until a capture is requested, so an idle bot pays no overhead.
+async def capture_cpu(seconds: float) -> str:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs()
+    out.write(
+        f"cProfile of the event loop thread for {seconds:g}s\n\n== By own time ==\n"
+    )
+    stats.sort_stats("tottime").print_stats(TOP_ENTRIES)
+    out.write("\n== By cumulative time ==\n")
+    stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+    return out.getvalue()
+
+
+def _sample_stacks(
+    thread_id: int, seconds: float, own: Counter, inclusive: Counter
+) -> int:
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples += 1
+            own[_describe(frame)] += 1
+            seen = set()
+            while frame is not None:
+                name = _describe(frame)
+                if name not in seen:
+                    seen.add(name)
+                    inclusive[name] += 1
+                frame = frame.f_back
+
+        time.sleep(SAMPLE_INTERVAL)
+
+    return samples
+
+
+def _describe(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+async def capture_sample(seconds: float) -> str:
+    # Samples the loop thread from a helper thread, so it also catches blocking calls.
+    own, inclusive = Counter(), Counter()
+    samples = await asyncio.to_thread(
+        _sample_stacks, threading.get_ident(), seconds, own, inclusive
+    )
+
+    lines = [
+        f"{samples} samples of the event loop thread every "
+        f"{SAMPLE_INTERVAL * 1000:g}ms for {seconds:g}s"
+    ]
+    for title, counter in (("Where the loop was", own), ("On the stack", inclusive)):
+        lines.append(f"\n== {title} ==")
+        for name, count in counter.most_common(TOP_ENTRIES):
+            lines.append(f"{count / max(samples, 1):>7.1%}  {name}")
+
+    return "\n".join(lines) + "\n"
+
+
+async def capture_memory(seconds: float) -> str:
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    lines = [
+        f"tracemalloc over {seconds:g}s: {current / 1024:.1f} KiB traced now, "
+        f"{peak / 1024:.1f} KiB peak",
+        "\n== Growth by line ==",
+    ]
+    for stat in after.compare_to(before, "lineno")[:TOP_ENTRIES]:
+        lines.append(str(stat))
+
+    lines.append("\n== Largest allocation sites ==")
+    for stat in after.statistics("traceback")[:TOP_ENTRIES]:
+        lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        for frame in stat.traceback.format()[-4:]:
+            lines.append(f"  {frame.strip()}")
+
+    linecache.clearcache()
+    return "\n".join(lines) + "\n"
+
+
+CAPTURES = {
+    "cpu": capture_cpu,
+    "sample": capture_sample,
+    "memory": capture_memory,
+}
+
+
+# COG
+class Profiler(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.lock = asyncio.Lock()
+
+    async def cog_check(self, ctx):
+        return await self.bot.is_owner(ctx.author)
+
+    @commands.group(invoke_without_command=True)
+    async def profile(self, ctx):
+        await ctx.send_help(ctx.command)
+
+    @profile.command(description="Profiles every call on the event loop with cProfile.")
+    async def cpu(self, ctx, seconds: float = DEFAULT_SECONDS):
+        await self.run(ctx, "cpu", seconds)
+
+    @profile.command(
+        description="Samples the event loop's stack, including blocking calls."
+    )
+    async def sample(self, ctx, seconds: float = DEFAULT_SECONDS):
+        await self.run(ctx, "sample", seconds)
+
+    @profile.command(
+        description="Shows memory growth and allocation sites with tracemalloc."
+    )
+    async def memory(self, ctx, seconds: float = DEFAULT_SECONDS):
+        await self.run(ctx, "memory", seconds)
+
+    async def run(self, ctx, kind, seconds):
+        if not 0 < seconds <= MAX_SECONDS:
+            await ctx.reply(
+                f"Pick a duration between 0 and {MAX_SECONDS} seconds.",
+                mention_author=False,
+            )
+            return
+
+        if self.lock.locked():
+            await ctx.reply("A capture is already running.", mention_author=False)
+            return
+
+        async with self.lock:
+            await ctx.reply(
+                f"Capturing a {kind} profile for {seconds:g}s...", mention_author=False
+            )
+            try:
+                report = await CAPTURES[kind](seconds)
+            except ValueError as e:
+                # cProfile refuses to start while another profiler is active.
+                await ctx.reply(
+                    f"The capture could not start: {e}", mention_author=False
+                )
+                return
+
+        filename = f"profile-{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.txt"
+        await ctx.reply(
+            f"{kind.capitalize()} profile for {seconds:g}s.",
+            file=discord.File(io.BytesIO(report.encode()), filename=filename),
+            mention_author=False,
+        )
+
+
+# SETUP
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Profiler(bot))
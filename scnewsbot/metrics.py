@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable
+from aiohttp import web
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_SAMPLES = 1024
+LAG_INTERVAL = 0.5
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent: deque[float] = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+    def percentile(self, fraction: float) -> float:
+        # Taken over the most recent samples so it reflects current behaviour.
+        if not self.recent:
+            return 0.0
+
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.latency: dict[str, Histogram] = {}
+        self.errors = Counter()
+        self.loop_lag = Histogram()
+        # Extra gauges (e.g. dispatcher queue depth), read when metrics are exported.
+        self.sources: dict[str, Callable[[], dict]] = {}
+
+    def observe(self, name: str, seconds: float, /, failed: bool = False) -> None:
+        if name not in self.latency:
+            self.latency[name] = Histogram()
+
+        self.latency[name].observe(seconds)
+        if failed:
+            self.errors[name] += 1
+
+    @contextmanager
+    def timer(self, name: str, /):
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, failed=failed)
+
+    def timed(self, name: str, /):
+        # Decorator for coroutine functions such as component callbacks.
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    async def watch_loop_lag(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.loop_lag.observe(
+                max(0.0, time.perf_counter() - started - LAG_INTERVAL)
+            )
+
+    # PROMETHEUS
+    def render(self) -> str:
+        lines = ["# TYPE scnewsbot_latency_seconds histogram"]
+        for name, histogram in sorted(self.latency.items()):
+            lines += _histogram_lines(
+                "scnewsbot_latency_seconds", histogram, f'name="{name}"'
+            )
+
+        lines.append("# TYPE scnewsbot_errors_total counter")
+        for name in sorted(self.latency):
+            lines.append(f'scnewsbot_errors_total{{name="{name}"}} {self.errors[name]}')
+
+        lines.append("# TYPE scnewsbot_event_loop_lag_seconds histogram")
+        lines += _histogram_lines("scnewsbot_event_loop_lag_seconds", self.loop_lag)
+
+        for source, read in sorted(self.sources.items()):
+            lines.append(f"# TYPE scnewsbot_{source} gauge")
+            for key, value in sorted(read().items()):
+                lines.append(f'scnewsbot_{source}{{key="{key}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(
+                text=self.render(), content_type="text/plain", charset="utf-8"
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def _histogram_lines(metric: str, histogram: Histogram, labels: str = "") -> list[str]:
+    prefix = f"{labels}," if labels else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{metric}_sum{suffix} {histogram.total}")
+    lines.append(f"{metric}_count{suffix} {histogram.count}")
+    return lines
+
+
+metrics = Metrics()
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import asyncio
+import sqlite3
+import threading
+from typing import NamedTuple
+
+INDEX_FILE = "announcements.db"
+SEARCH_LIMIT = 10
+# bm25 weights for the title and description columns.
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+class IndexedAnnouncement(NamedTuple):
+    message_id: int
+    guild_id: int
+    channel_id: int
+    author_id: int
+    posted_at: float
+    title: str
+    description: str
+    url: str | None
+    image_url: str | None
+
+
+# Local SQLite FTS5 index of posted announcements, so old posts can be found and
+# edited without scrolling channels or fetching messages.
+class AnnouncementIndex:
+    def __init__(self, path: str = INDEX_FILE) -> None:
+        self.path = path
+        self.conn: sqlite3.Connection | None = None
+        # Calls come from worker threads, one at a time.
+        self.lock = threading.Lock()
+
+    def open(self) -> None:
+        if self.conn is not None:
+            return
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS announcements (
+                message_id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                author_id INTEGER NOT NULL,
+                posted_at REAL NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL,
+                url TEXT,
+                image_url TEXT
+            );
+            CREATE INDEX IF NOT EXISTS announcements_guild
+                ON announcements (guild_id, posted_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS announcements_fts USING fts5(
+                title, description, content='announcements', content_rowid='message_id'
+            );
+            CREATE TRIGGER IF NOT EXISTS announcements_ai
+            AFTER INSERT ON announcements BEGIN
+                INSERT INTO announcements_fts (rowid, title, description)
+                VALUES (new.message_id, new.title, new.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_ad
+            AFTER DELETE ON announcements BEGIN
+                INSERT INTO announcements_fts
+                    (announcements_fts, rowid, title, description)
+                VALUES ('delete', old.message_id, old.title, old.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_au
+            AFTER UPDATE ON announcements BEGIN
+                INSERT INTO announcements_fts
+                    (announcements_fts, rowid, title, description)
+                VALUES ('delete', old.message_id, old.title, old.description);
+                INSERT INTO announcements_fts (rowid, title, description)
+                VALUES (new.message_id, new.title, new.description);
+            END;
+            """)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _record_many(self, rows: list[IndexedAnnouncement], /) -> None:
+        # Edits keep the original author and post time.
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO announcements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (message_id) DO UPDATE SET
+                    title = excluded.title,
+                    description = excluded.description,
+                    url = excluded.url,
+                    image_url = excluded.image_url
+                """,
+                rows,
+            )
+
+    def _search(
+        self, guild_id: int, terms: str, limit: int, /
+    ) -> list[IndexedAnnouncement]:
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT a.* FROM announcements_fts
+                JOIN announcements a ON a.message_id = announcements_fts.rowid
+                WHERE announcements_fts MATCH ? AND a.guild_id = ?
+                ORDER BY bm25(announcements_fts, ?, ?), a.posted_at DESC
+                LIMIT ?
+                """,
+                (
+                    to_match_query(terms),
+                    guild_id,
+                    TITLE_WEIGHT,
+                    DESCRIPTION_WEIGHT,
+                    limit,
+                ),
+            ).fetchall()
+
+        return [IndexedAnnouncement(*row) for row in rows]
+
+    def _authors(self, message_ids: list[int], /) -> dict[int, int]:
+        placeholders = ", ".join("?" * len(message_ids))
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT message_id, author_id FROM announcements"
+                f" WHERE author_id != 0 AND message_id IN ({placeholders})",
+                message_ids,
+            ).fetchall()
+
+        return dict(rows)
+
+    async def authors(self, message_ids: list[int], /) -> dict[int, int]:
+        # Who posted each message through the bot, where that is known.
+        if not message_ids:
+            return {}
+
+        return await asyncio.to_thread(self._authors, message_ids)
+
+    async def record(self, *rows: IndexedAnnouncement) -> None:
+        await asyncio.to_thread(self._record_many, list(rows))
+
+    async def search(
+        self, guild_id: int, terms: str, /, limit: int = SEARCH_LIMIT
+    ) -> list[IndexedAnnouncement]:
+        if not to_match_query(terms):
+            return []
+
+        return await asyncio.to_thread(self._search, guild_id, terms, limit)
+
+
+def to_match_query(terms: str, /) -> str:
+    # Every word is quoted so FTS syntax in user input is matched literally, and prefix
+    # matched so "evo" finds "Evocati".
+    words = [word.replace('"', '""') for word in terms.split()]
+    return " ".join(f'"{word}"*' for word in words if word.strip('"'))
+
+
+def indexed_from_message(message, /, author_id: int = 0) -> IndexedAnnouncement:
+    # An author of 0 means unknown; recording it never replaces a known author.
+    embed = message.embeds[0]
+    return IndexedAnnouncement(
+        message.id,
+        message.guild.id,
+        message.channel.id,
+        author_id,
+        message.created_at.timestamp(),
+        embed.title or "",
+        embed.description or "",
+        embed.url,
+        embed.image.url if embed.image else None,
+    )
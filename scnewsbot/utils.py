@@ -1,64 +1,147 @@
+import os
+import tomllib
+from types import MappingProxyType
 from discord.ext import commands
 
 
 class Config:
-    def __init__(self, config: dict):
-        self.config = config
+    # Compiled once from the TOML data and never changed; reloading builds a new Config.
+    __slots__ = (
+        "config",
+        "path",
+        "mtime",
+        "debug",
+        "prefix",
+        "extensions",
+        "watch",
+        "fast_startup",
+        "shard_count",
+        "repost_channels",
+        "publish_channels",
+        "metrics_host",
+        "metrics_port",
+        "allowed_guilds",
+        "allowed_roles",
+        "allowed_users",
+        "guilds",
+    )
+
+    def __init__(
+        self, config: dict, /, path: str | None = None, mtime: float | None = None
+    ):
+        bot = config.get("bot", {})
+        debug = config.get("debug", False)
+
+        set_field = object.__setattr__
+        set_field(self, "config", MappingProxyType(config))
+        set_field(self, "path", path)
+        set_field(self, "mtime", mtime)
+        set_field(self, "debug", debug)
+        set_field(self, "prefix", bot.get("prefix", "sc "))
+        set_field(self, "extensions", tuple(bot.get("extensions", ["jishaku"])))
+        set_field(self, "watch", bot.get("watch_config", False))
+        set_field(self, "fast_startup", bot.get("fast_startup", False))
+        shards = bot.get("shards", 1)
+        set_field(self, "shard_count", None if shards == "auto" else int(shards))
+        set_field(self, "repost_channels", frozenset(bot.get("repost_channels", [])))
+        set_field(self, "publish_channels", frozenset(bot.get("publish_channels", [])))
+
+        metrics = config.get("metrics", {})
+        set_field(self, "metrics_host", metrics.get("host", "127.0.0.1"))
+        set_field(self, "metrics_port", metrics.get("port"))
+
+        permissions = config.get("permissions", {})
+        debug_permissions = permissions.get("debug", {}) if debug else {}
+        for object_name in ("allowed_guilds", "allowed_roles", "allowed_users"):
+            set_field(
+                self,
+                object_name,
+                frozenset(permissions.get(object_name, []))
+                | frozenset(debug_permissions.get(object_name, [])),
+            )
+
+        guilds = config.get("guilds", {})
+        set_field(
+            self,
+            "guilds",
+            MappingProxyType(
+                {
+                    int(guild_id): GuildOptions(
+                        {"leaderboard": f"leaderboard-{guild_id}", **table}
+                    )
+                    for guild_id, table in guilds.items()
+                }
+            ),
+        )
+
+    @classmethod
+    def from_file(cls, path: str, /) -> "Config":
+        with open(path, "rb") as config_file:
+            mtime = os.fstat(config_file.fileno()).st_mtime
+            return cls(tomllib.load(config_file), path=path, mtime=mtime)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("Config is immutable; load a new one instead.")
 
     @property
     def embed_color(self) -> int:
         return 0x0504AA
 
-    @property
-    def debug(self) -> bool:
-        return self.config.get("debug", False)
 
-    @property
-    def prefix(self) -> str:
-        return self.config["bot"].get("prefix", "sc ")
-
-    @property
-    def extensions(self) -> list:
-        return self.config["bot"].get("extensions", ["jishaku"])
-
-    @property
-    def repost_channels(self) -> list[int]:
-        return self.config["bot"].get("repost_channels", [])
-
-    @property
-    def publish_channels(self) -> list[int]:
-        return self.config["bot"].get("publish_channels", [])
-
-    @property
-    def allowed_guilds(self) -> list:
-        return self._get_allowed_objects("allowed_guilds")
-
-    @property
-    def allowed_roles(self) -> list:
-        return self._get_allowed_objects("allowed_roles")
-
-    @property
-    def allowed_users(self) -> list:
-        return self._get_allowed_objects("allowed_users")
-
-    def _get_allowed_objects(self, object_name, /) -> list:
-        allowed_objects = self.config["permissions"].get(object_name, [])
-        if self.debug:
-            allowed_objects += self.config["permissions"]["debug"].get(object_name, [])
-
-        return allowed_objects
+class GuildOptions:
+    # One guild's announcement options, indexed for the lookups the components make.
+    __slots__ = (
+        "channel_options",
+        "ping_role_options",
+        "channel_names",
+        "ping_role_names",
+        "leaderboard_channels",
+        "logging_channels",
+        "leaderboard",
+    )
+
+    def __init__(self, table: dict, /):
+        channels = tuple(
+            (name, int(channel_id)) for name, channel_id in table.get("channels", [])
+        )
+        ping_roles = tuple(
+            (name, int(role_id)) for name, role_id in table.get("ping_roles", [])
+        )
+
+        set_field = object.__setattr__
+        set_field(self, "channel_options", channels)
+        set_field(self, "ping_role_options", ping_roles)
+        set_field(
+            self,
+            "channel_names",
+            MappingProxyType({channel_id: name for name, channel_id in channels}),
+        )
+        set_field(
+            self,
+            "ping_role_names",
+            MappingProxyType({role_id: name for name, role_id in ping_roles}),
+        )
+        set_field(
+            self,
+            "leaderboard_channels",
+            frozenset(table.get("leaderboard_channels", [])),
+        )
+        set_field(self, "logging_channels", tuple(table.get("logging_channels", [])))
+        set_field(self, "leaderboard", table.get("leaderboard", "leaderboard"))
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("GuildOptions is immutable; load a new Config instead.")
 
 
 def can_publish_announcements(ctx: commands.Context) -> bool:
     if not ctx.guild:
         return False
 
-    if ctx.author.id in ctx.bot.config.allowed_users:
+    config = ctx.bot.config
+    if ctx.author.id in config.allowed_users:
         return True
 
-    if ctx.guild.id in ctx.bot.config.allowed_guilds:
-        for allowed_role in ctx.bot.config.allowed_roles:
-            if allowed_role in ctx.author._roles:
-                return True
-
-    return False
+    return (
+        ctx.guild.id in config.allowed_guilds
+        and not config.allowed_roles.isdisjoint(ctx.author._roles)
+    )
@@ -0,0 +1,74 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any
+
+FLUSH_DELAY = 2
+
+
+# Changes are queued by the subclass and written in batches from a worker thread, at
+# most FLUSH_DELAY seconds after the first one.
+class WriteBehind(ABC):
+    def __init__(self) -> None:
+        self.flush_task: asyncio.Task | None = None
+        self.flush_lock = asyncio.Lock()
+
+    def schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the bot (scripts, imports) there is no loop to defer to.
+            self._finish_flush(self._write(self._take_pending()))
+            return
+
+        if self.flush_task is None:
+            self.flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(FLUSH_DELAY)
+        # Now writing: close() waits for this flush instead of cancelling it.
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self.flush_lock:
+            job = self._take_pending()
+            if job is None:
+                return
+
+            # The worker thread can't be interrupted, so a cancelled flush still holds
+            # the lock until its write is done, and then passes the cancellation on.
+            write = asyncio.ensure_future(asyncio.to_thread(self._write, job))
+            cancelled = False
+            while not write.done():
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    cancelled = True
+
+            self._finish_flush(write.result())
+            if cancelled:
+                raise asyncio.CancelledError
+
+    async def close(self) -> None:
+        # Only a flush still waiting out FLUSH_DELAY is cancelled; flush() below then
+        # waits on the lock for any write in progress before writing what is left.
+        task, self.flush_task = self.flush_task, None
+        if task is not None:
+            task.cancel()
+
+        await self.flush()
+
+    @abstractmethod
+    def _take_pending(self) -> Any:
+        # Called on the loop: returns a job for _write, or None when there is nothing
+        # to write.
+        ...
+
+    @abstractmethod
+    def _write(self, job: Any, /) -> Any:
+        # Called on a worker thread with a job from _take_pending.
+        ...
+
+    def _finish_flush(self, result: Any, /) -> None:
+        # Called on the loop with what _write returned.
+        pass